@@ -1,172 +1,530 @@
-import interface as iff
-from time import perf_counter
+"""Benchmark suite. Run from the command line, e.g.
+
+    python benchmarks.py --nodes 100 1000 10000 --bits 32 --json results.json
+    python benchmarks.py --nodes 1000000 --backend array
+    python benchmarks.py --baseline results.json --plot plots/
+    python benchmarks.py --nodes 10000 --workers 1 2 4 8
+    python benchmarks.py --nodes 1000 --latency 16
+    python benchmarks.py --nodes 1000 --storage /tmp/chord-items
+    python benchmarks.py --nodes 1000 --trace 0.05 --profile profiles/
+    python benchmarks.py --nodes 1000 --threads 8 --stress-seconds 10
+
+Every node count is measured on a ring built from the same seed. Each
+operation runs its warmup samples first, then the timed ones. Results
+hold p50/p99/mean latency (µs) and throughput (ops/s) per operation.
+The array backend keeps items in one dict, without routing, so its item
+operations are named insert_local, get_local etc. and aren't compared
+with the object backend's."""
+
+import argparse
+import json
+import math
+import os
 import random
-from main import KS
-import matplotlib.pyplot as plt
+import shutil
+import sys
+import tempfile
+import threading
+import traceback
+from bisect import bisect_left
+from time import perf_counter, perf_counter_ns
+import interface as iff
+from config import RingConfig
+from simulation import ArrayRing, MAX_KEY_SIZE
+from latency import CoordinateLatency
+import parallel
+from profiling import Profiler
+
+# Fraction of nodes that fail at once
+FAIL_FRACTION = 0.25
+# Node count from which the auto backend switches to ArrayRing
+ARRAY_BACKEND_NODES = 100000
+# Nodes a range query spans on average
+RANGE_NODES = 4
+# k of kNN queries
+KNN_K = 5
+# Items the stress test reads and writes
+STRESS_KEYS = 1000
+# Stress test roles, by thread number
+STRESS_ROLES = ["lookup", "read", "write"]
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def measure(op, args: list, warmup: int) -> dict:
+    """Calls op(arg) for every arg, timing all but the first warmup calls."""
+
+    warmup = min(warmup, len(args) // 2)
+    for arg in args[:warmup]:
+        op(arg)
+    times = []
+    for arg in args[warmup:]:
+        start = perf_counter_ns()
+        op(arg)
+        times.append(perf_counter_ns() - start)
+    times.sort()
+    total = sum(times)
+    return {
+        "samples": len(times),
+        "p50_us": percentile(times, 50) / 1000,
+        "p99_us": percentile(times, 99) / 1000,
+        "mean_us": total / len(times) / 1000 if times else 0.0,
+        "throughput": len(times) / (total / 1e9) if total else 0.0,
+    }
+
+def timed(function, *args) -> float:
+    """Runs function once, returns the time it took in ms."""
 
-HS = 2**KS
+    start = perf_counter()
+    function(*args)
+    return (perf_counter() - start) * 1000
 
-def benchmark(NC: int, results: dict) -> dict:
-    interface = iff.Interface()
+def load_items(path: str, count: int) -> list[tuple]:
+    """Items of the csv at path, or count synthetic items if it doesn't exist."""
 
-    # Build network with NC nodes
-    build_start = perf_counter()
-    interface.build_network(NC)
-    build_end = perf_counter()
+    if os.path.exists(path):
+        return list(iff.parse_csv(path).items())
+    print(f"{path} not found, using {count} synthetic items.")
+    return [(f"Item {i}", {"value": i}) for i in range(count)]
 
-    # Insert all data to the network
-    data_start = perf_counter()
-    items = iff.parse_csv("NH4_NO3.csv")
-    interface.insert_all_data(items.items())
-    data_end = perf_counter()
+def snapshot_path(args, config: RingConfig, node_count: int) -> str | None:
+    if not args.snapshots:
+        return None
+    return os.path.join(args.snapshots, f"ring-{config.ks}-{node_count}-{args.seed}")
 
-    # Generate random numbers to use for benchmarking
-    run_count = 10
-    random_nodes = random.sample(sorted(interface.nodes), run_count*2)
-    (leave_n, ex_match_n) = (random_nodes[:run_count], random_nodes[run_count:])
+def build_ring(args, config: RingConfig, node_count: int, items: list[tuple]) -> tuple:
+    """Builds the object ring for node_count nodes. With snapshots, the
+    ring is always loaded from its snapshot, saved first if missing, so
+    every run measures the same frozen ring.
+    Returns (interface, build or load ms, data ms)."""
 
-    search_keys = random.sample(range(HS), run_count)
+    path = snapshot_path(args, config, node_count)
+    if path is None or not os.path.exists(os.path.join(path, "meta.json")):
+        storage_dir = None
+        if args.storage and path is None:
+            storage_dir = os.path.join(args.storage, f"ring-{config.ks}-{node_count}-{args.seed}")
+            # Every run starts from empty stores
+            shutil.rmtree(storage_dir, ignore_errors=True)
+        interface = iff.Interface(config, storage_dir=storage_dir)
+        build_ms = timed(interface.build_network, node_count)
+        data_ms = timed(interface.insert_all_data, items)
+        if path is None:
+            return interface, build_ms, data_ms
+        interface.save_snapshot(path)
+    start = perf_counter()
+    interface = iff.Interface.from_snapshot(path)
+    return interface, (perf_counter() - start) * 1000, 0.0
+
+def benchmark_object(args, config: RingConfig, node_count: int, items: list[tuple]) -> dict:
+    """Benchmarks the Interface (one Node object per node)."""
+
+    interface, build_ms, data_ms = build_ring(args, config, node_count, items)
+    # Same workload whether the ring was built or loaded
+    random.seed(args.seed)
+    hs = config.hs
+    n = args.samples + args.warmup
+    first_node = interface.get_node()
+    keys = [random.randrange(hs) for _ in range(n)]
+    span = max(hs // node_count * RANGE_NODES, 1)
+    new_items = [(f"Bench key {i}", f"Bench data {i}") for i in range(n)]
+    node_ids = sorted(interface.nodes)
+    ops = {}
+    hops = []
+    result = {"backend": "object", "build_ms": build_ms, "data_ms": data_ms}
+    if args.workers:
+        print("Benchmarking parallel lookups...")
+        result["parallel"] = benchmark_parallel(args, interface, config, node_count)
+    if args.latency:
+        print("Benchmarking simulated lookup latency...")
+        result["latency"] = benchmark_latency(args, interface, keys)
+
+    tracer = interface.trace_lookups(args.trace, seed=args.seed) if args.trace else None
+
+    def lookup(key: int) -> None:
+        hops.append(interface.route(first_node, key)[1])
+
+    print("Benchmarking item operations...")
+    ops["insert"] = measure(lambda item: interface.insert_item(item, first_node.id), new_items, args.warmup)
+    ops["update"] = measure(lambda item: interface.update_record((item[0], "Updated"), first_node.id),
+                            new_items, args.warmup)
+    ops["get"] = measure(lambda item: interface.get_item(item[0], first_node.id), new_items, args.warmup)
+    ops["delete"] = measure(lambda item: interface.delete_item(item[0], first_node.id), new_items, args.warmup)
+    print("Benchmarking lookups and queries...")
+    ops["lookup"] = measure(lookup, keys, args.warmup)
+    ops["exact_match"] = measure(interface.exact_match, random.choices(node_ids, k=n), args.warmup)
+    ops["range_query"] = measure(lambda key: interface.range_query(key, (key + span) % hs), keys, args.warmup)
+    ops["range_scan"] = measure(lambda key: sum(1 for _ in interface.scan(key, (key + span) % hs)), keys, args.warmup)
+    ops["knn"] = measure(lambda node_id: interface.knn(KNN_K, node_id), random.choices(node_ids, k=n), args.warmup)
+    ops["knn_key"] = measure(lambda key: interface.knn_key(KNN_K, key), keys, args.warmup)
+    ops["lookup_batch"] = measure(lambda batch: interface.lookup_many(batch),
+                                  [[item[0] for item in new_items[i:i + 100]] for i in range(0, n, 100)], 1)
+    print("Benchmarking joins and leaves...")
+    ops["join"] = measure(interface.node_join, interface.random_ids(min(n, hs - node_count)), args.warmup)
+    ops["leave"] = measure(interface.node_leave, random.sample(sorted(interface.nodes), min(n, node_count // 2)),
+                           args.warmup)
+
+    if tracer is not None:
+        interface.tracer = None
+        result["trace"] = {
+            "sampled": tracer.sampled,
+            "finger_usage": tracer.finger_usage(),
+            "slowest": tracer.slowest(5),
+        }
+
+    print("Benchmarking massive nodes' failure...")
+    interface.fail_nodes(FAIL_FRACTION)
     first_node = interface.get_node()
+    found = []
+    ops["lookup_after_failure"] = measure(lambda key: found.append(first_node.find_successor(key)), keys, 0)
+    alive_ids = sorted(interface.nodes)
+    successes = sum(1 for key, node in zip(keys, found)
+                    if node is not None and node.id == alive_ids[bisect_left(alive_ids, key) % len(alive_ids)])
+
+    result["mean_hops"] = sum(hops) / len(hops) if hops else 0.0
+    result["failure_success_rate"] = successes / len(keys)
+    result["ops"] = ops
+    return result
+
+def benchmark_parallel(args, interface: iff.Interface, config: RingConfig, node_count: int) -> dict:
+    """Aggregate lookups per second on a process pool, per worker count.
+    Workers load the ring's snapshot, or a temporary one."""
+
+    # Own generator, so the other operations' workload stays the same
+    rng = random.Random(args.seed)
+    keys = [rng.randrange(config.hs) for _ in range(args.parallel_lookups)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = snapshot_path(args, config, node_count)
+        if path is None:
+            path = tmp
+            interface.save_snapshot(path)
+        stats = parallel.scaling(path, keys, args.workers)
+    return {str(workers): {
+        "qps": worker_stats["qps"],
+        "mean_hops": worker_stats["mean_hops"],
+        "worker_qps": [worker["qps"] for worker in worker_stats["per_worker"]],
+    } for workers, worker_stats in stats.items()}
+
+def benchmark_latency(args, interface: iff.Interface, keys: list[int]) -> dict:
+    """Simulated lookup latency (ms) and hops on synthetic coordinates,
+    with exact fingers and with fingers picked by proximity among
+    args.latency candidates. Leaves the ring with exact fingers."""
 
-    join_nodes = []
-    count = 0
-    for i in range(HS):
-        if i not in interface.nodes:
-            count += 1
-            join_nodes.append(i)
-            if count >= run_count//2:
-                break
-
-    in_keys = []
-    in_data = []
-    up_data = []
-
-    for i in range(run_count):
-        in_keys.append(f"In key {i}")
-        in_data.append(f"In data {i}")
-        up_data.append(f"Updata {i}")
-
-    # Start process benchmarking NC Nodes
-
-    # Insert key
-    print("Benchmarking insert key...")
-    in_key_start = perf_counter()
-    for index, key in enumerate(in_keys):
-        interface.insert_item((key, in_data[index]), first_node.id)
-    in_key_end = perf_counter()
-
-    # Update record based on key
-    print("Benchmarking Update record based on key...")
-    up_key_start = perf_counter()
-    for key in in_keys:
-        interface.update_record((key, up_data[index]), first_node.id)
-    up_key_end = perf_counter()
-
-    # Delete key
-    print("Benchmarking Delete key...")
-    del_key_start = perf_counter()
-    for key in in_keys:
-        interface.delete_item(key=key, start_node_id=first_node.id)
-    del_key_end = perf_counter()
-
-    # Key lookup 
-    print("Benchmarking Key lookup...")
-    query_start = perf_counter()
-    for key in search_keys:
-        first_node.find_successor(key)
-    query_end = perf_counter()
-
-    # Node join
-    print("Benchmarking Node join...")
-    join_start = perf_counter()
-    for key in join_nodes:
-        interface.node_join(new_node_id=key)
-    join_end = perf_counter()
-
-    # Exact match
-    print("Benchmarking Exact match...")
-    ex_match_start = perf_counter()
-    for key in ex_match_n:
-        interface.exact_match(key=key)
-    ex_match_end = perf_counter()
-
-    # Node Leave
-    print("Benchmarking Node Leave...")
-    leave_start = perf_counter()
-    for key in leave_n:
-        interface.node_leave(key)
-    leave_end = perf_counter()
-
-    # Range query
-    print("Benchmarking Range query...")
-    range_start = perf_counter()
-    for key in search_keys:
-        interface.range_query(key, (key+20) % HS )
-    range_end = perf_counter()
-
-    # kNN query
-    print("Benchmarking kNN query...")
-    knn_start = perf_counter()
-    for key in join_nodes:
-        interface.knn(5, key)
-    knn_end = perf_counter()
-
-    #results['Build'][NC] = (build_end - build_start) * 1000
-    #results['Insert all data'][NC] = (data_end - data_start) * 1000
-    results['Insert key'][NC] = (in_key_end - in_key_start) * 1000 / run_count
-    results['Delete key'][NC] = (del_key_end - del_key_start) * 1000 / run_count
-    results['Update key'][NC] = (up_key_end - up_key_start) * 1000 / run_count
-    results['Key lookup'][NC] = (query_end - query_start) * 1000 / run_count
-    results['Node Join'][NC] = (join_end - join_start) * 1000 / (run_count/2)
-    results['Node Leave'][NC] = (leave_end - leave_start) * 1000 / run_count
-    #results['Massive Nodes\' failure'][NC] = (mnn_end - mnn_start)
-    results['Exact match'][NC] = (ex_match_end - ex_match_start) * 1000 / run_count
-    results['Range Query'][NC] = (range_end - range_start) * 1000 / run_count
-    results['kNN Query'][NC] = (knn_end - knn_start) * 1000 / run_count
+    results = {}
+    for name, candidates in (("exact", 1), ("pns", args.latency)):
+        interface.set_latency_model(CoordinateLatency(seed=args.seed, candidates=candidates))
+        lookups = [interface.lookup_latency(key) for key in keys]
+        latencies = sorted(latency for _, _, latency in lookups)
+        results[name] = {
+            "mean_ms": sum(latencies) / len(latencies),
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "mean_hops": sum(hops for _, hops, _ in lookups) / len(lookups),
+        }
+    interface.set_latency_model(None)
     return results
 
-def benchmark_all() -> dict:
-    answer = {
-        #"Build": {},
-        #"Insert all data": {},
-        "Insert key": {},
-        "Delete key": {},
-        "Update key": {},
-        "Key lookup": {},
-        "Node Join": {},
-        "Node Leave": {},
-        #"Massive Nodes' failure": {},
-        "Exact match": {},
-        "Range Query": {},
-        "kNN Query": {}
+def benchmark_stress(args, config: RingConfig, node_count: int) -> dict:
+    """Runs args.threads threads of lookups, reads and writes, plus one of
+    churn (joins and leaves), on a thread-safe ring for args.stress_seconds.
+    Returns throughput per operation and consistency violations: lookups
+    answered by a node that doesn't own the key, reads older than the last
+    acknowledged write of their key, and errors raised by any thread."""
+
+    random.seed(args.seed)
+    interface = iff.Interface(config, thread_safe=True)
+    interface.build_network(node_count)
+    keys = [f"Stress key {i}" for i in range(STRESS_KEYS)]
+    interface.insert_items([(key, 0) for key in keys])
+    # key: last version a writer got back from update_record
+    acked = dict.fromkeys(keys, 0)
+    writers = [i for i in range(args.threads) if STRESS_ROLES[i % len(STRESS_ROLES)] == "write"]
+    ops = {role: 0 for role in STRESS_ROLES + ["churn"]}
+    violations = {"lookup": 0, "read": 0, "errors": 0}
+    errors = []
+    counts_lock = threading.Lock()
+    deadline = perf_counter() + args.stress_seconds
+
+    def lookup(rng: random.Random) -> bool:
+        key_hash = rng.randrange(config.hs)
+        # Membership can't change between the lookup and the check
+        with interface.read_locked():
+            node = interface.find_responsible(key_hash)
+            ids = interface.sorted_ids
+            return node is not None and node.alive and node.id == ids[bisect_left(ids, key_hash) % len(ids)]
+
+    def read(rng: random.Random) -> bool:
+        key = rng.choice(keys)
+        version = acked[key]
+        value = interface.get_item(key)
+        return value is not None and value >= version
+
+    def write(rng: random.Random, own_keys: list[str], versions: dict) -> None:
+        key = rng.choice(own_keys)
+        versions[key] += 1
+        interface.update_record((key, versions[key]))
+        acked[key] = versions[key]
+
+    def churn(rng: random.Random) -> None:
+        if rng.random() < 0.5 or len(interface.nodes) <= node_count // 2:
+            interface.node_join(interface.random_ids(1)[0])
+        else:
+            interface.node_leave(interface.get_random_node().id)
+
+    def worker(number: int, role: str) -> None:
+        rng = random.Random(args.seed + number)
+        done = failed = 0
+        if role == "write":
+            # Every key has one writer, so its versions only go up
+            own_keys = keys[writers.index(number)::len(writers)]
+            versions = {key: acked[key] for key in own_keys}
+        try:
+            while perf_counter() < deadline:
+                if role == "lookup":
+                    failed += not lookup(rng)
+                elif role == "read":
+                    failed += not read(rng)
+                elif role == "write":
+                    write(rng, own_keys, versions)
+                else:
+                    churn(rng)
+                done += 1
+        except Exception:
+            with counts_lock:
+                violations["errors"] += 1
+                errors.append(traceback.format_exc())
+        with counts_lock:
+            ops[role] += done
+            if role in violations:
+                violations[role] += failed
+
+    threads = [threading.Thread(target=worker, args=(i, STRESS_ROLES[i % len(STRESS_ROLES)]))
+               for i in range(args.threads)]
+    threads.append(threading.Thread(target=worker, args=(args.threads, "churn")))
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    if errors:
+        print(errors[0])
+    return {
+        "threads": args.threads + 1,
+        "seconds": elapsed,
+        "ops": ops,
+        "throughput": {role: count / elapsed for role, count in ops.items()},
+        "violations": violations,
+    }
+
+def benchmark_array(args, config: RingConfig, node_count: int, items: list[tuple]) -> dict:
+    """Benchmarks ArrayRing, the NumPy simulation backend."""
+
+    ring = ArrayRing(config)
+    build_ms = timed(ring.build_network, node_count)
+    data_ms = timed(ring.insert_all_data, items)
+    random.seed(args.seed)
+    hs = config.hs
+    n = args.samples + args.warmup
+    keys = [random.randrange(hs) for _ in range(n)]
+    span = max(hs // node_count * RANGE_NODES, 1)
+    new_items = [(f"Bench key {i}", f"Bench data {i}") for i in range(n)]
+    ops = {}
+
+    # Unrouted dict operations, named apart from the object backend's routed ones
+    print("Benchmarking item operations...")
+    ops["insert_local"] = measure(ring.insert_item, new_items, args.warmup)
+    ops["update_local"] = measure(lambda item: ring.update_record((item[0], "Updated")), new_items, args.warmup)
+    ops["get_local"] = measure(lambda item: ring.get_item(item[0]), new_items, args.warmup)
+    ops["delete_local"] = measure(lambda item: ring.delete_item(item[0]), new_items, args.warmup)
+    print("Benchmarking lookups and queries...")
+    ops["lookup"] = measure(ring.find_successor, keys, args.warmup)
+    ops["exact_match"] = measure(ring.exact_match, random.choices(ring.ids.tolist(), k=n), args.warmup)
+    ops["range_query"] = measure(lambda key: ring.range_query(key, (key + span) % hs), keys, args.warmup)
+    ops["knn"] = measure(lambda node_id: ring.knn(KNN_K, node_id), random.choices(ring.ids.tolist(), k=n), args.warmup)
+    ops["knn_key"] = measure(lambda key: ring.knn_key(KNN_K, key), keys, args.warmup)
+    ops["lookup_batch"] = measure(lambda batch: ring.route(batch), [keys[i:i + 100] for i in range(0, n, 100)], 1)
+    _, hops = ring.route(keys)
+    print("Benchmarking joins and leaves...")
+    ops["join"] = measure(ring.node_join, ring.random_ids(min(n, hs - node_count)), args.warmup)
+    ops["leave"] = measure(ring.node_leave, random.sample(ring.ids.tolist(), min(n, node_count // 2)), args.warmup)
+
+    return {
+        "backend": "array",
+        "build_ms": build_ms,
+        "data_ms": data_ms,
+        "mean_hops": float(hops.mean()),
+        "ops": ops,
     }
-    for i in range(20, 301, 40):
-        print(f"\nBenchmarking {i} nodes...\n")
-        answer = benchmark(i, answer)
-    return answer
-
-def results_print(results: dict) -> None:
-    for process in results.items():
-        print(f"\n{process[0]} times:")
-        for node_count, time in process[1].items():
-            print(f"{process[0]} time for {node_count} nodes: {time}")
-
-def plot_results(results: dict) -> dict[plt.plot]:
-    # X axis = Node count, Y axis = Time
-    plots = {}
-    for process in results.items():
-        plt.figure(process[0])
-        plots[process[0]] = plt.plot([nc[0] for nc in process[1].items()],\
-            [t[1] for t in process[1].items()])
-        if process[0] != "Node Join" and process[0] != "Node Leave":
-            plt.axis([20, 300, 0, 0.1])
-        plt.xlabel("Node Count")
-        plt.ylabel("Time (ms)")
-        plt.title(process[0])
-        plt.show()
-
-    return plots
-
-results = benchmark_all()
-plot_results(results)
-#results_print(benchmark_all())
\ No newline at end of file
+
+def run(args) -> dict:
+    config = RingConfig(args.bits, args.sls)
+    items = load_items(args.data, args.items)
+    results = {}
+    for node_count in args.nodes:
+        if node_count > config.hs:
+            print(f"Skipping {node_count} nodes, the ring only has {config.hs} ids.")
+            continue
+        backend = args.backend
+        if backend == "auto":
+            backend = "array" if node_count >= ARRAY_BACKEND_NODES and args.bits <= MAX_KEY_SIZE else "object"
+        print(f"\nBenchmarking {node_count} nodes ({backend} backend)...\n")
+        # Same ring and workload for a node count on every run
+        random.seed(args.seed)
+        if backend == "array":
+            results[str(node_count)] = benchmark_array(args, config, node_count, items)
+        elif args.profile:
+            profiler = Profiler(cprofile=True)
+            with profiler.hooks():
+                results[str(node_count)] = benchmark_object(args, config, node_count, items)
+            os.makedirs(args.profile, exist_ok=True)
+            profiler.write_collapsed(os.path.join(args.profile, f"collapsed-{node_count}.txt"))
+            profiler.profile.dump_stats(os.path.join(args.profile, f"profile-{node_count}.pstats"))
+            results[str(node_count)]["profile"] = profiler.totals()
+        else:
+            results[str(node_count)] = benchmark_object(args, config, node_count, items)
+        if args.threads:
+            print(f"Stress testing {node_count} nodes with {args.threads} threads...")
+            results[str(node_count)]["stress"] = benchmark_stress(args, config, node_count)
+    return {
+        "config": {
+            "bits": args.bits,
+            "sls": args.sls,
+            "seed": args.seed,
+            "samples": args.samples,
+            "warmup": args.warmup,
+            "items": len(items),
+        },
+        "results": results,
+    }
+
+def results_print(report: dict) -> None:
+    for node_count, result in report["results"].items():
+        print(f"\n{node_count} nodes ({result['backend']}): build {result['build_ms']:.1f} ms, "
+              f"data {result['data_ms']:.1f} ms, mean hops {result['mean_hops']:.2f}")
+        if "failure_success_rate" in result:
+            print(f"Lookup success rate after {FAIL_FRACTION:.0%} of nodes failed: "
+                  f"{result['failure_success_rate']:.0%}")
+        for workers, stats in result.get("parallel", {}).items():
+            print(f"Parallel lookups with {workers} worker(s): {stats['qps']:.0f}/s")
+        if "trace" in result:
+            slowest = result["trace"]["slowest"]
+            print(f"Traced {result['trace']['sampled']} lookups, slowest "
+                  f"{slowest[0]['total_ns'] / 1000 if slowest else 0:.1f} µs")
+        for method, stats in result.get("profile", {}).items():
+            print(f"Profiled {method}: {stats['calls']} calls, {stats['ms']:.1f} ms")
+        if "stress" in result:
+            stress = result["stress"]
+            print(f"Stress test, {stress['threads']} threads: " +
+                  ", ".join(f"{role} {rate:.0f}/s" for role, rate in stress["throughput"].items()) +
+                  "; violations: " + ", ".join(f"{kind} {count}" for kind, count in stress["violations"].items()))
+        for fingers, stats in result.get("latency", {}).items():
+            print(f"Simulated lookup latency ({fingers} fingers): mean {stats['mean_ms']:.1f} ms, "
+                  f"p99 {stats['p99_ms']:.1f} ms, mean hops {stats['mean_hops']:.2f}")
+        print(f"{'operation':<22}{'p50 µs':>12}{'p99 µs':>12}{'ops/s':>14}")
+        for op, stats in result["ops"].items():
+            print(f"{op:<22}{stats['p50_us']:>12.1f}{stats['p99_us']:>12.1f}{stats['throughput']:>14.0f}")
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lists the operations whose p50 latency is more than tolerance
+    (a fraction) above the baseline's, for node counts in both."""
+
+    regressions = []
+    print(f"\nComparison with baseline (p50, tolerance {tolerance:.0%}):")
+    for node_count, result in report["results"].items():
+        base = baseline["results"].get(node_count)
+        if base is None:
+            continue
+        for op, stats in result["ops"].items():
+            if op not in base["ops"] or not base["ops"][op]["p50_us"]:
+                continue
+            ratio = stats["p50_us"] / base["ops"][op]["p50_us"]
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "REGRESSION"
+                regressions.append(f"{op} at {node_count} nodes")
+            print(f"{node_count:>8} {op:<22}{base['ops'][op]['p50_us']:>10.1f} -> {stats['p50_us']:>10.1f} µs"
+                  f"  x{ratio:.2f} {flag}")
+    return regressions
+
+def plot_results(report: dict, directory: str) -> None:
+    """Saves p50/p99 latency against node count, one png per operation."""
+
+    # Optional dependency, without a display
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(directory, exist_ok=True)
+    node_counts = [int(node_count) for node_count in report["results"]]
+    ops = {op for result in report["results"].values() for op in result["ops"]}
+    for op in sorted(ops):
+        counts = [nc for nc in node_counts if op in report["results"][str(nc)]["ops"]]
+        fig, ax = plt.subplots()
+        for stat in ("p50_us", "p99_us"):
+            ax.plot(counts, [report["results"][str(nc)]["ops"][op][stat] for nc in counts], marker="o", label=stat[:3])
+        ax.set_xscale("log")
+        ax.set_xlabel("Node Count")
+        ax.set_ylabel("Time (µs)")
+        ax.set_title(op)
+        ax.legend()
+        fig.savefig(os.path.join(directory, f"{op}.png"))
+        plt.close(fig)
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chord DHT benchmark suite")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[20, 100, 1000, 10000], help="node counts to benchmark")
+    parser.add_argument("--bits", type=int, default=32, help="key size of the ring (bits)")
+    parser.add_argument("--sls", type=int, default=RingConfig().sls, help="successor list size")
+    parser.add_argument("--backend", choices=["auto", "object", "array"], default="auto",
+                        help=f"auto uses the array backend from {ARRAY_BACKEND_NODES} nodes, "
+                        f"if bits is at most {MAX_KEY_SIZE}")
+    parser.add_argument("--samples", type=int, default=200, help="timed samples per operation")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed warmup samples per operation")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    parser.add_argument("--data", default="NH4_NO3.csv", help="csv of items to insert")
+    parser.add_argument("--items", type=int, default=10000, help="synthetic items if the csv doesn't exist")
+    parser.add_argument("--snapshots", help="directory of ring snapshots, reused across runs")
+    parser.add_argument("--workers", type=int, nargs="+", help="also measure lookups on process pools of these sizes")
+    parser.add_argument("--parallel-lookups", type=int, default=100000, help="lookups per process pool measurement")
+    parser.add_argument("--latency", type=int, metavar="CANDIDATES",
+                        help="also compare simulated lookup latency of exact and proximity-picked fingers")
+    parser.add_argument("--storage", help="keep items in durable logs under this directory (ignored with --snapshots)")
+    parser.add_argument("--trace", type=float, metavar="RATE", help="trace this fraction of the lookups")
+    parser.add_argument("--profile", help="profile node hot paths (object backend), writing "
+                        "cProfile stats and collapsed stacks to this directory")
+    parser.add_argument("--threads", type=int, help="also stress test a thread-safe ring with this many "
+                        "lookup/read/write threads, plus one of churn")
+    parser.add_argument("--stress-seconds", type=float, default=5.0, help="duration of the stress test")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown against the baseline")
+    parser.add_argument("--plot", help="save plots to this directory")
+    args = parser.parse_args(argv)
+    if args.backend == "array" and args.bits > MAX_KEY_SIZE:
+        parser.error(f"the array backend supports at most {MAX_KEY_SIZE} bits")
+    return args
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    results_print(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.plot:
+        plot_results(report, args.plot)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
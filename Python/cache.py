@@ -0,0 +1,76 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from config import RingConfig
+from locks import NO_LOCK
+
+class LookupCache:
+    """LRU cache of key-hash ranges (pred, node] and their responsible node.
+    Nodes invalidate their entry whenever the range they own changes."""
+
+    def __init__(self, size: int, config: RingConfig) -> None:
+        self.size = size
+        self.config = config
+        # node id: (pred id, node), least recently used first
+        self.entries = OrderedDict()
+        # Sorted node ids of the cached ranges
+        self.ends = []
+        self.hits = 0
+        self.misses = 0
+        # Replaced by a real lock when the network is thread safe
+        self.lock = NO_LOCK
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key_hash: int):
+        """Returns the cached node responsible for key_hash, or None."""
+
+        with self.lock:
+            if self.ends:
+                # Only the first cached range ending at or after key_hash can contain it
+                end = self.ends[bisect_left(self.ends, key_hash) % len(self.ends)]
+                start, node = self.entries[end]
+                if not node.alive:
+                    self.invalidate(end)
+                # key_hash ∈ (pred, node]
+                elif self.config.in_range(key_hash, start, end):
+                    self.entries.move_to_end(end)
+                    self.hits += 1
+                    return node
+            self.misses += 1
+            return None
+
+    def put(self, node) -> None:
+        """Caches the range owned by node."""
+
+        with self.lock:
+            if node.id in self.entries:
+                self.entries.move_to_end(node.id)
+            else:
+                insort(self.ends, node.id)
+            self.entries[node.id] = (node.pred.id, node)
+
+            if len(self.entries) > self.size:
+                evicted, _ = self.entries.popitem(last=False)
+                del self.ends[bisect_left(self.ends, evicted)]
+
+    def invalidate(self, node_id: int) -> None:
+        """Drops the range ending at node_id, if cached."""
+
+        with self.lock:
+            if self.entries.pop(node_id, None) is not None:
+                del self.ends[bisect_left(self.ends, node_id)]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.ends = []
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,47 @@
+import hashlib
+
+class RingConfig:
+    """Identifier space and parameters of a ring.
+    Shared by an Interface and all of its nodes."""
+
+    def __init__(self, key_size: int = 4, succ_list_size: int = 3, replication: int = 1,
+                 read_quorum: int = 1, write_quorum: int = 1) -> None:
+        if not 1 <= replication <= succ_list_size + 1:
+            raise ValueError("Replication factor must be between 1 and successor list size + 1")
+        if not (1 <= read_quorum <= replication and 1 <= write_quorum <= replication):
+            raise ValueError("Quorums must be between 1 and the replication factor")
+        # Key size (bits)
+        self.ks = key_size
+        # Hashing space
+        self.hs = 2**key_size
+        # Successor list size
+        self.sls = succ_list_size
+        # Copies of every item: the owner's and replication - 1 successors'
+        self.replication = replication
+        # Replicas that must answer a read / acknowledge a write
+        self.read_quorum = read_quorum
+        self.write_quorum = write_quorum
+
+    def hash_func(self, data: str) -> int:
+        """SHA-1 of data, mapped to the hashing space."""
+
+        digest = hashlib.sha1(data.encode("utf-8")).digest()
+        return int.from_bytes(digest, "big") % self.hs
+
+    def cw_dist(self, k1: int, k2: int) -> int:
+        """Clockwise distance of 2 keys"""
+
+        return (k2 - k1) % self.hs
+
+    def comp_cw_dist(self, k1: int, k2: int, dest: int) -> bool:
+        """Returns true if clockwise distance of k1 from dest
+        is bigger than clockwise distance of k2 from dest.
+        In other words, k2 ∈ (k1, dest]"""
+
+        return (dest - k1) % self.hs > (dest - k2) % self.hs
+
+    def in_range(self, key: int, start: int, end: int) -> bool:
+        """Returns true if key ∈ (start, end].
+        If start == end the range is the whole ring."""
+
+        return start == end or 0 < (key - start) % self.hs <= (end - start) % self.hs
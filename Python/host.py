@@ -0,0 +1,28 @@
+class Host:
+    """Physical node owning one or more ring positions (virtual nodes)."""
+
+    def __init__(self, host_id: int) -> None:
+        self.id = host_id
+        # Virtual nodes of this host
+        self.vnodes = []
+
+def load_stats(loads: list) -> dict:
+    """Mean, max, max/mean ratio and Gini coefficient of loads."""
+
+    if not loads:
+        return {"mean": 0.0, "max": 0, "max_mean": 0.0, "gini": 0.0}
+    loads = sorted(loads)
+    total = sum(loads)
+    mean = total / len(loads)
+    if total == 0:
+        gini = 0.0
+    else:
+        # Gini = 2 * Σ i * x_i / (n * Σ x_i) - (n + 1) / n, x sorted, i from 1
+        weighted = sum(i * load for i, load in enumerate(loads, 1))
+        gini = 2 * weighted / (len(loads) * total) - (len(loads) + 1) / len(loads)
+    return {
+        "mean": mean,
+        "max": loads[-1],
+        "max_mean": loads[-1] / mean if mean else 0.0,
+        "gini": gini,
+    }
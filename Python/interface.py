@@ -1,95 +1,605 @@
 from xmlrpc.client import boolean
-from node import Node, hash_func, cw_dist
+from node import Node
+from config import RingConfig
+from network import NetworkRing
+from cache import LookupCache
+from host import Host, load_stats
+import snapshot
+import storage
+from metrics import Metrics
+from latency import LatencyModel
+from profiling import LookupTracer, Profiler, HOOKS
+from contextlib import contextmanager
+from functools import wraps
+from locks import RWLock, NO_LOCK
+from bisect import bisect_left, bisect_right, insort
+import os
 import random
+import threading
 import pandas as pd
-from main import HS, KS
+
+# Item fields, in csv column order
+CSV_FIELDS = ['Date', 'Block', 'Plot', 'Experimental_treatment', 'Soil_NH4', 'Soil_NO3']
 
 def parse_csv(filename: str) -> dict:
     """Parses csv and returns a list of items."""
 
-    items = {}
     df = pd.read_csv(filename)
-
-    for i in range(len(df)):
-        key = '_'.join([df.values[i][0], str(df.values[i][2])])
-
-        data = {
-            'Date': df.values[i][0],
-            'Block': df.values[i][1],
-            'Plot': df.values[i][2],
-            'Experimental_treatment': df.values[i][3],
-            'Soil_NH4': df.values[i][4],
-            'Soil_NO3': df.values[i][5],
-        }
-        items[key] = data
-    
-    return items
+    df = df.iloc[:, :len(CSV_FIELDS)].set_axis(CSV_FIELDS, axis=1)
+
+    # Key: Date_Plot, built column-wise
+    # map(str), unlike astype(str), turns missing values into "nan" on every pandas version
+    keys = df['Date'].map(str) + '_' + df['Plot'].map(str)
+    return dict(zip(keys.tolist(), df.to_dict('records')))
+
+def shared(method):
+    """Runs an Interface method under the ring's read lock, if thread safe."""
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        if self.lock is None:
+            return method(self, *args, **kwargs)
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return locked
+
+def exclusive(method):
+    """Runs an Interface method under the ring's write lock, if thread safe."""
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        if self.lock is None:
+            return method(self, *args, **kwargs)
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return locked
 
 class Interface:
-    def __init__(self) -> None:
+    """A Chord ring and its operations. With thread_safe, many threads can
+    use it at once: lookups and item operations share the ring's read lock
+    and lock the nodes whose items they touch, while membership changes
+    take the write lock, so readers never see half of a join or leave."""
+
+    def __init__(self, config: RingConfig = None, cache_size: int = 0, metrics: bool = False,
+                 latency: LatencyModel = None, storage_dir: str = None, thread_safe: bool = False) -> None:
+        self.config = config if config is not None else RingConfig()
         self.nodes = {}
-        
-    def build_network(self, node_count: int, node_ids: list = []) -> None:
-        """Creates nodes and inserts them into the network."""
-
-        if node_ids == []:
-            final_ids = random.sample(range(HS), node_count)
+        # Node ids in ring order, for ordered queries
+        self.sorted_ids = []
+        # Node ids in no particular order and their positions, for sampling
+        self.members = []
+        self.member_pos = {}
+        # Bumped on every join, leave and failure
+        self.membership_version = 0
+        # Physical hosts of virtual nodes, host id: Host
+        self.hosts = {}
+        # Optional cache of key-hash ranges to responsible nodes
+        self.cache = LookupCache(cache_size, self.config) if cache_size else None
+        # Optional counters and histograms, see Metrics
+        self.metrics = Metrics() if metrics else None
+        # Optional latency model, fingers are then picked by proximity
+        self.latency = latency
+        # Optional tracer of sampled lookups, see trace_lookups
+        self.tracer = None
+        # Optional directory of durable item stores, one per node
+        self.storage_dir = storage_dir
+        if storage_dir is not None:
+            storage.save_config(storage_dir, self.config)
+        # Readers-writer lock of the ring, if thread safe
+        self.lock = RWLock() if thread_safe else None
+        if thread_safe:
+            if self.cache is not None:
+                self.cache.lock = threading.RLock()
+            if self.metrics is not None:
+                self.metrics.lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, path: str, cache_size: int = 0, metrics: bool = False,
+                      latency: LatencyModel = None, thread_safe: bool = False) -> 'Interface':
+        """Creates a network from a snapshot saved with save_snapshot.
+        Fingers are loaded as saved, whatever latency is."""
+
+        interface = cls(snapshot.read_config(path), cache_size, metrics, latency, thread_safe=thread_safe)
+        snapshot.load(interface, path)
+        return interface
+
+    @classmethod
+    def from_storage(cls, path: str, cache_size: int = 0, metrics: bool = False,
+                     latency: LatencyModel = None, thread_safe: bool = False) -> 'Interface':
+        """Restarts a network whose items were stored in directory path:
+        replays every node's log and rebuilds the ring around them."""
+
+        interface = cls(storage.read_config(path), cache_size, metrics, latency, path, thread_safe)
+        interface.bulk_build(sorted(storage.node_ids(path)))
+        for node in interface.nodes.values():
+            node.rereplicate()
+        return interface
+
+    @shared
+    def commit_storage(self) -> None:
+        """Commits every node's buffered writes to disk."""
+
+        for node in self.nodes.values():
+            if isinstance(node.items, storage.LogStore):
+                with node.lock:
+                    node.items.commit()
+
+    @exclusive
+    def compact_storage(self) -> None:
+        for node in self.nodes.values():
+            if isinstance(node.items, storage.LogStore):
+                node.items.compact()
+
+    @shared
+    def save_snapshot(self, path: str) -> None:
+        """Saves nodes, finger tables, successor lists and items to directory path."""
+
+        snapshot.save(self, path)
+
+    def read_locked(self):
+        """Context manager holding the ring's read lock, if thread safe."""
+
+        return self.lock.read() if self.lock is not None else NO_LOCK
+
+    def write_locked(self):
+        """Context manager holding the ring's write lock, if thread safe."""
+
+        return self.lock.write() if self.lock is not None else NO_LOCK
+
+    @exclusive
+    def build_network(self, node_count: int, node_ids: list = None, vnodes: int = 1) -> None:
+        """Creates nodes and inserts them into the network.
+        With vnodes > 1, creates node_count hosts of vnodes virtual nodes each.
+        node_ids, if given, are used instead of random ids and node_count,
+        each vnodes consecutive ids making a host. Ids outside the hashing
+        space, repeated or already in the network are skipped first."""
+
+        if not node_ids:
+            final_ids = self.random_ids(node_count * vnodes)
         else: 
-            final_ids = node_ids
+            final_ids = []
+            seen = set()
+            for node_id in node_ids:
+                if not 0 <= node_id < self.config.hs:
+                    print(f"{hex(node_id)} not in hashing space, can't create node.")
+                elif node_id in seen:
+                    print(f"Node id {hex(node_id)} given more than once.")
+                elif node_id in self.nodes:
+                    print(f"Node {hex(node_id)} already in the network.")
+                else:
+                    seen.add(node_id)
+                    final_ids.append(node_id)
+            if len(final_ids) % vnodes:
+                print(f"{len(final_ids)} node ids can't be split into hosts of {vnodes} virtual nodes.")
+                return
 
-        for x in final_ids:
-            self.node_join(new_node_id=x)
+        hosts = None
+        if vnodes > 1:
+            hosts = []
+            for i in range(len(final_ids) // vnodes):
+                host = Host(max(self.hosts, default=-1) + 1)
+                self.hosts[host.id] = host
+                hosts.extend([host] * vnodes)
+        self.bulk_build(final_ids, hosts)
+
+    @exclusive
+    def bulk_build(self, node_ids: list[int], hosts: list[Host] = None) -> None:
+        """Adds many nodes at once, instead of one node_join each. The ring is
+        sorted once, every finger is found with a bisect over it, and preds,
+        successor lists and items are wired in one pass.
+        hosts, if given, holds the host of each node id."""
+
+        old_ids = self.sorted_ids
+        old_holders = {node_id: self.nodes[node_id].replica_holders()[1:] for node_id in old_ids}
+        new_nodes = []
+        for i, node_id in enumerate(node_ids):
+            if not 0 <= node_id < self.config.hs:
+                print(f"{hex(node_id)} not in hashing space, can't create node.")
+                continue
+            if node_id in self.nodes:
+                continue
+            node = self.new_node(node_id, hosts[i] if hosts is not None else None)
+            self.add_member(node, keep_sorted=False)
+            new_nodes.append(node)
+        self.sort_members()
+
+        ring_ids = self.sorted_ids
+        ring = [self.nodes[node_id] for node_id in ring_ids]
+        count = len(ring)
+        succ_count = min(self.config.sls, count - 1)
+        for pos, node in enumerate(ring):
+            node.pred = ring[pos - 1]
+            for i, finger_pos in enumerate(node.f_pos):
+                # First node with id ≥ finger position
+                node.set_finger(i, ring[bisect_left(ring_ids, finger_pos) % count])
+            node.succ_list = [ring[(pos + s) % count] for s in range(1, succ_count + 1)]
+            node.succ_list += [None] * (self.config.sls - succ_count)
+        if self.latency is not None:
+            # Needs every successor pointer set
+            for node in ring:
+                node.select_fingers()
+
+        # New nodes take their range over from the old node that held it
+        if old_ids:
+            for node in new_nodes:
+                holder = self.nodes[old_ids[bisect_left(old_ids, node.id) % len(old_ids)]]
+                holder.move_items_to(node, node.pred.id, node.id)
+            if self.cache is not None:
+                self.cache.clear()
+            for node in ring:
+                node.rereplicate(old_holders.get(node.id, []))
+
+    def add_member(self, node: Node, keep_sorted: bool = True) -> None:
+        """Adds node to the membership indexes. If keep_sorted is false,
+        call sort_members once all nodes are added."""
+
+        self.nodes[node.id] = node
+        self.membership_version += 1
+        self.member_pos[node.id] = len(self.members)
+        self.members.append(node.id)
+        if keep_sorted:
+            insort(self.sorted_ids, node.id)
+
+    def sort_members(self) -> None:
+        self.sorted_ids = sorted(self.nodes)
+
+    def remove_member(self, node_id: int) -> Node:
+        """Removes node_id from the membership indexes and returns its node."""
+
+        node = self.nodes.pop(node_id)
+        self.membership_version += 1
+        del self.sorted_ids[bisect_left(self.sorted_ids, node_id)]
+        # Move the last member into the freed slot
+        pos = self.member_pos.pop(node_id)
+        last = self.members.pop()
+        if last != node_id:
+            self.members[pos] = last
+            self.member_pos[last] = pos
+        return node
+
+    @exclusive
+    def add_host(self, vnodes: int, node_ids: list = []) -> Host:
+        """Adds a physical host owning vnodes ring positions."""
+
+        host = Host(max(self.hosts, default=-1) + 1)
+        self.hosts[host.id] = host
+        for node_id in node_ids or self.random_ids(vnodes):
+            self.node_join(new_node_id=node_id, host=host)
+        return host
+
+    @exclusive
+    def remove_host(self, host_id: int) -> None:
+        """Removes a host and all of its virtual nodes from the network."""
+
+        if host_id not in self.hosts:
+            print(f"Host with id {host_id} not found.")
+            return
+        for vnode in list(self.hosts[host_id].vnodes):
+            self.node_leave(vnode.id)
+        del self.hosts[host_id]
+
+    @shared
+    def load_report(self) -> dict:
+        """Load distribution over physical hosts: owned arc of the ring and
+        item count per host, with mean, max, max/mean and Gini coefficient.
+        Nodes without a host count as hosts of their own."""
+
+        node_ids = self.sorted_ids
+        arcs = {}
+        items = {}
+        for i, node_id in enumerate(node_ids):
+            node = self.nodes[node_id]
+            owner = node.host if node.host is not None else node
+            # Arc (previous node, node]; a lone node owns the whole ring
+            arc = self.config.cw_dist(node_ids[i - 1], node_id) or self.config.hs
+            arcs[owner] = arcs.get(owner, 0) + arc
+            items[owner] = items.get(owner, 0) + len(node.items)
+        return {
+            "hosts": len(arcs),
+            "nodes": len(node_ids),
+            "arc": load_stats(list(arcs.values())),
+            "items": load_stats(list(items.values())),
+        }
             
-    def node_join(self, new_node_id: int, start_node_id: int = None, print_node: boolean = False) -> None:
-        """Adds node to the network."""
+    @exclusive
+    def node_join(self, new_node_id: int, start_node_id: int = None, print_node: boolean = False,
+                  maintain: bool = True, host: Host = None) -> int:
+        """Adds node to the network. If maintain is false, other nodes'
+        fingers are left to a Stabilizer.
+        Returns the number of finger table entries rewritten."""
         
-        if new_node_id not in range(HS):
+        if not 0 <= new_node_id < self.config.hs:
             print(f"{hex(new_node_id)} not in hashing space, can't create node.")
             return
+        if new_node_id in self.nodes:
+            print(f"Node {hex(new_node_id)} already in the network.")
+            return
         if print_node:
             print(f"Creating and adding node {hex(new_node_id)} to the network...")
-        new_node = Node(new_node_id)
+        new_node = self.new_node(new_node_id, host)
+        touched = 0
         # First node.
         if not self.nodes:
             new_node.pred = new_node
             # Initialize finger table.
-            new_node.f_table = [ [(new_node.id + 2**i) % HS, new_node] for i in range(KS) ]
+            for i in range(self.config.ks):
+                new_node.set_finger(i, new_node)
         else:
             start_node = self.get_node(start_node_id)
             # Find new node successor and insert the new node before it.
-            start_node.find_successor(new_node.id).insert_new_pred(new_node)
+            touched = start_node.find_successor(new_node.id).insert_new_pred(new_node, maintain=maintain)
 
-        self.nodes[new_node.id] = new_node
+        self.add_member(new_node)
+        if self.metrics is not None:
+            self.metrics.observe("join_fingers_rewritten", touched)
+        return touched
 
+    @shared
     def insert_item(self, new_item: tuple, start_node_id: int = None) -> None:
         """Inserts an item (key, value) to the correct node of the network."""
 
-        start_node = self.get_node(start_node_id)
-        succ = start_node.find_successor(hash_func(new_item[0]))
-        succ.insert_item_to_node(new_item)
+        key_hash = self.config.hash_func(new_item[0])
+        succ = self.find_responsible(key_hash, start_node_id)
+        if succ is None:
+            return
+        self.insert_at(succ, new_item, key_hash)
         #print(f"Inserting item with hashed key: {hash_func(new_item[0]} to node with ID: {succ.id}")
 
+    @shared
+    def insert_at(self, owner: Node, new_item: tuple, key_hash: int) -> None:
+        """Inserts an item to owner, the node responsible for it, and its replicas."""
+
+        with owner.lock:
+            owner.insert_item_to_node(new_item, key_hash=key_hash)
+            self.write_replicas(owner, new_item[0], key_hash, new_item[1])
+
+    @shared
     def delete_item(self, key: str, start_node_id: int = None, item_print=False):
         """Finds node responsible for key and removes the (key, value) entry from it."""
 
-        start_node = self.get_node(start_node_id)
-        start_node.find_successor(hash_func(key)).delete_item_from_node(key,item_print=item_print)
+        key_hash = self.config.hash_func(key)
+        responsible_node = self.find_responsible(key_hash, start_node_id)
+        if responsible_node is not None and not self.delete_at(responsible_node, key, key_hash, item_print):
+            print(f"Key {key} not found")
+
+    @shared
+    def delete_at(self, owner: Node, key: str, key_hash: int, item_print=False) -> bool:
+        """Removes key from owner, the node responsible for it, and its replicas.
+        Returns false if owner doesn't have key."""
+
+        with owner.lock:
+            if not owner.claim_item(key):
+                return False
+            owner.delete_item_from_node(key, item_print=item_print)
+            self.write_replicas(owner, key, key_hash, delete=True)
+            return True
         
+    @exclusive
     def insert_all_data(self, dict_items: list[tuple], start_node_id: int = None) -> None:
-        """Inserts all data from parsed csv into the correct nodes."""
+        """Inserts all data from parsed csv into the correct nodes.
+        Items are sorted by hash and each node gets its slice directly,
+        without routing every item through the ring, so start_node_id
+        only has to name a node of the network."""
+
+        if not self.nodes:
+            print("Network is empty, can't insert data.")
+            return
+        if self.get_node(start_node_id) is None:
+            return
 
-        for dict_item in dict_items:
-            self.insert_item(dict_item, start_node_id)
+        keys, values = [], []
+        for key, value in dict_items:
+            keys.append(key)
+            values.append(value)
+        hashes = [self.config.hash_func(key) for key in keys]
+        order = sorted(range(len(keys)), key=hashes.__getitem__)
+        hashes = [hashes[i] for i in order]
+        keys = [keys[i] for i in order]
+        values = [values[i] for i in order]
+
+        node_ids = self.sorted_ids
+        slices = []
+        lo = 0
+        for node_id in node_ids:
+            # hash ∈ (previous node, node]
+            hi = bisect_right(hashes, node_id, lo)
+            if hi > lo:
+                slices.append((self.nodes[node_id], lo, hi))
+            lo = hi
+        # Hashes after the last node wrap around to the first one
+        if lo < len(hashes):
+            slices.append((self.nodes[node_ids[0]], lo, len(hashes)))
+
+        for node, lo, hi in slices:
+            node.insert_items_to_node(hashes[lo:hi], keys[lo:hi], values[lo:hi])
+            # Only the inserted slice is copied to the replica holders
+            if self.config.replication > 1:
+                copies = dict(zip(keys[lo:hi], zip(hashes[lo:hi], values[lo:hi])))
+                for holder in node.replica_holders()[1:]:
+                    holder.replicas.update(copies)
         
+    @shared
     def update_record(self, new_item: tuple, start_node_id: int = None, print_item: bool = False) -> None:
         """Updates the record (value) of an item given its key."""
 
-        start_node = self.get_node(start_node_id)
-        responsible_node = start_node.find_successor(hash_func(new_item[0]))
-        if new_item[0] in responsible_node.items:
-            responsible_node.insert_item_to_node(new_item, print_item=print_item)
+        key_hash = self.config.hash_func(new_item[0])
+        responsible_node = self.find_responsible(key_hash, start_node_id)
+        if responsible_node is not None and not self.update_at(responsible_node, new_item, key_hash, print_item):
+            print(f"Could not find item with key {new_item[0]}")
+
+    @shared
+    def update_at(self, owner: Node, new_item: tuple, key_hash: int, print_item: bool = False) -> bool:
+        """Updates an item on owner, the node responsible for it, and its replicas.
+        Returns false if owner doesn't have the item."""
+
+        with owner.lock:
+            if not owner.claim_item(new_item[0]):
+                return False
+            owner.insert_item_to_node(new_item, print_item=print_item)
+            self.write_replicas(owner, new_item[0], key_hash, new_item[1])
+            return True
+
+    @shared
+    def get_item(self, key: str, start_node_id: int = None):
+        """Returns the value of an item given its key, or None if it's not found.
+        Reads from read_quorum replicas, the nearest first if there's a latency
+        model, else in random order so reads spread over all of them, and
+        returns the value most of them agree on."""
+
+        owner = self.find_responsible(self.config.hash_func(key), start_node_id)
+        if owner is None:
+            return
+        return self.get_at(owner, key, self.get_node(start_node_id))
+
+    @shared
+    def get_at(self, owner: Node, key: str, start_node: Node = None):
+        """Reads key from the replicas of owner, the node responsible for it,
+        as get_item does. start_node is where the read comes from."""
+
+        if start_node is None:
+            start_node = owner
+        if self.latency is not None:
+            holders = sorted(owner.replica_holders(), key=lambda n: self.latency.latency(start_node.id, n.id))
+        else:
+            holders = owner.replica_holders()
+            holders = random.sample(holders, len(holders))
+        if len(holders) < self.config.read_quorum:
+            print(f"Read quorum not reached for key {key}: {len(holders)}/{self.config.read_quorum} replicas.")
+            return
+
+        # A holder may not have its copy yet (its successor list isn't
+        # stabilized), so holders are read until read_quorum have the key
+        missing = object()
+        values = []
+        for holder in holders:
+            with holder.lock:
+                value = holder.get_local(key, missing)
+            if value is not missing:
+                values.append(value)
+                if len(values) >= self.config.read_quorum:
+                    break
+        if not values:
+            print(f"Key {key} not found")
             return
-        print(f"Could not find item with key {new_item[0]}")
+        # Most common value, the first read replica's on ties
+        return max(values, key=lambda value: (values.count(value), -values.index(value)))
+
+    def write_replicas(self, owner: Node, key: str, key_hash: int, value=None, delete: bool = False) -> None:
+        """Applies a write, already done on owner, to its replicas.
+        Warns if fewer than write_quorum replicas took it."""
+
+        if self.config.replication < 2:
+            return
+        holders = owner.replica_holders()
+        for holder in holders[1:]:
+            if delete:
+                holder.replicas.pop(key, None)
+            else:
+                holder.replicas[key] = (key_hash, value)
+        if len(holders) < self.config.write_quorum:
+            print(f"Write quorum not reached for key {key}: {len(holders)}/{self.config.write_quorum} replicas.")
+
+    async def start_network(self) -> NetworkRing:
+        """Runs every node as a TCP peer on 127.0.0.1.
+        The returned ring offers the item operations over RPC."""
+
+        ring = NetworkRing(self)
+        await ring.start()
+        return ring
+
+    @shared
+    def route_many(self, keys: list[str], start_node_id: int = None) -> list[tuple]:
+        """Routes a batch of keys in ring order. Each key starts from the
+        node that answered the previous one, or is answered by it directly
+        if its hash is ∈ (node.pred, node].
+        Returns (key, hash, node, hops) tuples sorted by hash."""
+
+        routed = []
+        node = self.get_node(start_node_id)
+        owner = None
+        for key_hash, key in sorted((self.config.hash_func(key), key) for key in keys):
+            if owner is not None and self.config.in_range(key_hash, owner.pred.id, owner.id):
+                self.record_lookup(owner, 0)
+                routed.append((key, key_hash, owner, 0))
+                continue
+            cached = self.cache.get(key_hash) if self.cache is not None else None
+            if cached is not None:
+                owner, hops = cached, 1
+            else:
+                owner, hops = self.route(node, key_hash)
+                if owner is None:
+                    print(f"Lookup of key {key} failed.")
+                elif self.cache is not None:
+                    self.cache.put(owner)
+            self.record_lookup(owner, hops, cached=cached is not None)
+            node = owner if owner is not None else node
+            routed.append((key, key_hash, owner, hops))
+        return routed
+
+    @shared
+    def lookup_many(self, keys: list[str], start_node_id: int = None) -> dict:
+        """Finds the responsible node of many keys.
+        Returns a dictionary key: (node, hops)."""
+
+        return {key: (node, hops) for key, _, node, hops in self.route_many(keys, start_node_id)}
+
+    @shared
+    def insert_items(self, new_items: list[tuple], start_node_id: int = None) -> None:
+        """Inserts a batch of items (key, value) to the correct nodes of the network."""
+
+        values = dict(new_items)
+        for key, key_hash, node, _ in self.route_many(values, start_node_id):
+            if node is not None:
+                with node.lock:
+                    node.insert_item_to_node((key, values[key]), key_hash=key_hash)
+                    self.write_replicas(node, key, key_hash, values[key])
+
+    @shared
+    def insert_routed(self, routed: list[tuple]) -> None:
+        """Inserts a batch of items routed outside this network, e.g. by
+        ParallelLookups. routed holds (key, value, hash, owner id, hops)
+        tuples. Items whose owner isn't responsible for them anymore are
+        routed again here."""
+
+        for key, value, key_hash, owner_id, hops in routed:
+            owner = self.nodes.get(owner_id)
+            if owner is None or not owner.alive or not self.config.in_range(key_hash, owner.pred.id, owner.id):
+                owner = self.find_responsible(key_hash)
+                if owner is None:
+                    continue
+            else:
+                self.record_lookup(owner, hops)
+                if self.cache is not None:
+                    self.cache.put(owner)
+            with owner.lock:
+                owner.insert_item_to_node((key, value), key_hash=key_hash)
+                self.write_replicas(owner, key, key_hash, value)
+
+    @shared
+    def update_records(self, new_items: list[tuple], start_node_id: int = None) -> None:
+        """Updates the records (values) of a batch of items given their keys."""
+
+        values = dict(new_items)
+        for key, key_hash, node, _ in self.route_many(values, start_node_id):
+            if node is None:
+                continue
+            with node.lock:
+                if node.claim_item(key):
+                    node.insert_item_to_node((key, values[key]))
+                    self.write_replicas(node, key, key_hash, values[key])
+                    continue
+            print(f"Could not find item with key {key}")
+
+    @shared
+    def delete_items(self, keys: list[str], start_node_id: int = None) -> None:
+        """Removes a batch of (key, value) entries from the network."""
+
+        for key, key_hash, node, _ in self.route_many(keys, start_node_id):
+            if node is not None:
+                with node.lock:
+                    node.claim_item(key)
+                    node.delete_item_from_node(key)
+                    self.write_replicas(node, key, key_hash, delete=True)
         
     def print_all_nodes(self, items_print = False, finger_print=False) -> None:
         """Prints all nodes of the network"""
@@ -99,10 +609,19 @@ class Interface:
         for n in sorted_nodes:
             n[1].print_node(finger_print=finger_print, items_print=items_print)
 
-    def node_leave(self, node_id: int, start_node_id: int = None, print_node = False) -> None:
-        """Removes node from network."""
+    @exclusive
+    def node_leave(self, node_id: int, start_node_id: int = None, print_node = False, maintain: bool = True) -> int:
+        """Removes node from network. If maintain is false, other nodes'
+        fingers are left to a Stabilizer.
+        Returns the number of finger table entries rewritten."""
 
-        node_to_remove = self.get_node(start_node_id).find_successor(node_id)
+        start_node = self.get_node(start_node_id)
+        if start_node is None:
+            return
+        node_to_remove = start_node.find_successor(node_id)
+        if node_to_remove is None:
+            print(f"Lookup of node {hex(node_id)} failed, all successors have failed.")
+            return
         if node_to_remove.id != node_id:
             print(f"Node {node_id} not found.")
             return
@@ -111,15 +630,159 @@ class Interface:
             print("Node that will be removed from network:")
             node_to_remove.print_node(items_print=True)
             print(f"Successor node before {hex(node_id)} leave:")
-            successor = node_to_remove.f_table[0][1]
+            successor = node_to_remove.f_nodes[0]
             successor.print_node(items_print=True)
         
-        node_to_remove.leave()
-        del(self.nodes[node_id])
+        touched = node_to_remove.leave(maintain=maintain)
+        self.remove_member(node_id)
+        if isinstance(node_to_remove.items, storage.LogStore):
+            node_to_remove.items.destroy()
+        if node_to_remove.host is not None:
+            node_to_remove.host.vnodes.remove(node_to_remove)
 
         if print_node:
             print(f"Successor node after {hex(node_id)} leave:")
             successor.print_node(items_print=True)
+        if self.metrics is not None:
+            self.metrics.observe("leave_fingers_rewritten", touched)
+        return touched
+
+    def new_node(self, node_id: int, host: Host = None) -> Node:
+        """Creates a node that shares this network's configuration and cache."""
+
+        node = Node(node_id, self.config)
+        node.cache = self.cache
+        node.metrics = self.metrics
+        node.latency = self.latency
+        if self.lock is not None:
+            node.lock = threading.RLock()
+        if self.storage_dir is not None:
+            node.items = storage.LogStore(os.path.join(self.storage_dir, f"{node_id:x}"))
+            # Items left by an earlier run
+            if node.items:
+                node.index_items()
+        if host is not None:
+            node.host = host
+            host.vnodes.append(node)
+        return node
+
+    @exclusive
+    def set_latency_model(self, latency: LatencyModel | None) -> None:
+        """Attaches latency to every node and picks the fingers again,
+        by proximity, or exact successors if latency is None."""
+
+        self.latency = latency
+        for node in self.nodes.values():
+            node.latency = latency
+        for node in self.nodes.values():
+            node.fix_fingers()
+
+    @shared
+    def lookup_latency(self, key_hash: int, start_node_id: int = None) -> tuple[Node | None, int, float]:
+        """Routes key_hash like find_responsible, without the cache.
+        Returns (responsible node, hops, simulated latency in ms): every hop
+        forwards the lookup, then the responsible node replies to the start node."""
+
+        if self.latency is None:
+            raise ValueError("Network has no latency model")
+        path = self.get_node(start_node_id).find_successor_path(key_hash)
+        node = path[-1]
+        hops = len(path) - 1
+        self.record_lookup(node, hops)
+        if node is None:
+            return None, hops, 0.0
+        ids = [hop.id for hop in path] + [path[0].id]
+        latency = self.latency.path_latency(ids)
+        if self.metrics is not None:
+            self.metrics.observe("lookup_latency_ms", latency)
+        return node, hops, latency
+
+    def trace_lookups(self, sample_rate: float = 0.01, max_traces: int = 1000, seed: int = None) -> LookupTracer:
+        """Starts tracing a sample of the lookups. Returns the tracer.
+        Set tracer to None to stop."""
+
+        self.tracer = LookupTracer(sample_rate, max_traces, seed)
+        return self.tracer
+
+    @contextmanager
+    def profile(self, cprofile: bool = False, hooks: list[str] = HOOKS):
+        """Profiles the hooked node methods inside the block:
+            with interface.profile() as profiler:
+                ...
+            profiler.write_collapsed("stacks.txt")"""
+
+        profiler = Profiler(cprofile)
+        with profiler.hooks(hooks):
+            yield profiler
+
+    def route(self, node: Node, key_hash: int) -> tuple[Node | None, int]:
+        """Routes key_hash from node, traced if the lookup is sampled.
+        Returns (responsible node, hops)."""
+
+        if self.tracer is not None and self.tracer.sample():
+            return self.tracer.trace(node, key_hash)
+        return node.find_successor_hops(key_hash)
+
+    @shared
+    def find_responsible(self, key_hash: int, start_node_id: int = None) -> Node | None:
+        """Returns the node responsible for key_hash.
+        Served from the lookup cache when possible."""
+
+        if self.cache is not None:
+            node = self.cache.get(key_hash)
+            if node is not None:
+                self.record_lookup(node, 1, cached=True)
+                return node
+        node, hops = self.route(self.get_node(start_node_id), key_hash)
+        self.record_lookup(node, hops)
+        if node is None:
+            print(f"Lookup of key {hex(key_hash)} failed, all successors have failed.")
+            return
+        if self.cache is not None:
+            self.cache.put(node)
+        return node
+
+    def record_lookup(self, node: Node | None, hops: int, cached: bool = False) -> None:
+        """Records a lookup's hops and the request it hands to node, if metrics are enabled."""
+
+        if self.metrics is None:
+            return
+        if node is None:
+            self.metrics.inc("failed_lookups")
+            return
+        if cached:
+            self.metrics.inc("cache_hits")
+        self.metrics.observe("lookup_hops", hops)
+        self.metrics.request(node.id)
+
+    @exclusive
+    def fail_node(self, node_id: int) -> None:
+        """Crash-stop failure: the node stops without leaving the network.
+        Its items are lost and nobody's pointers are updated."""
+
+        if node_id not in self.nodes:
+            print(f"Node with id {node_id} not found.")
+            return
+        node = self.remove_member(node_id)
+        node.alive = False
+        # Uncommitted writes are lost too, and the node never comes back
+        if isinstance(node.items, storage.LogStore):
+            node.items.destroy()
+        if node.host is not None:
+            node.host.vnodes.remove(node)
+        if self.cache is not None:
+            self.cache.invalidate(node_id)
+
+    @exclusive
+    def fail_nodes(self, fraction: float) -> list[int]:
+        """Fails a random fraction of the nodes at once, keeping at least one.
+        Returns the failed node ids."""
+
+        count = min(int(len(self.nodes) * fraction), len(self.nodes) - 1)
+        failed = random.sample(self.members, count)
+        for node_id in failed:
+            self.fail_node(node_id)
+        return failed
 
     def get_node(self, node_id: int = None) -> Node:
         """Returns node with id node_id. If it's not found,
@@ -135,89 +798,225 @@ class Interface:
         
         # If nodes dictionary is not empty
         if self.nodes:
-            # Return first inserted node
-            first_in_node = list(self.nodes.items())[0][1]
-            #print(f"Returning first inserted node with id: {hex(first_in_node.id)}")
-            return first_in_node
+            # Return first inserted node, dictionaries keep insertion order
+            return next(iter(self.nodes.values()))
 
+    @shared
     def range_query(self, start: int, end:int, start_node_id: int = None) -> list[Node]:
         """Lists the nodes in the range [start, end]."""
 
         nodes_in_range = []
-        first_node = self.get_node(start_node_id).find_successor(start)
+        start_node = self.get_node(start_node_id)
+        if start_node is None:
+            return nodes_in_range
+        first_node = start_node.find_successor(start)
+        if first_node is None:
+            print(f"Lookup of key {hex(start)} failed, all successors have failed.")
+            return nodes_in_range
         current = first_node
         
         # current id ∈ [start, end]
-        while cw_dist(start, end) >= cw_dist(current.id, end):
+        while self.config.cw_dist(start, end) >= self.config.cw_dist(current.id, end):
             nodes_in_range.append(current)
-            current = current.f_table[0][1]
+            current = current.f_nodes[0]
             if (current == first_node):
                 return nodes_in_range
 
         return nodes_in_range
         
         
+    def scan(self, start: int, end: int, start_node_id: int = None, batch_size: int = 1000, limit: int = None):
+        """Yields the (key, hash, value) items with hash ∈ [start, end], in ring
+        order, reading batch_size items at a time from each node. Stops after
+        limit items, or when the caller stops iterating. The network may
+        change between batches: items added or removed meanwhile may or may
+        not be seen."""
+
+        for batch in self.scan_batches(start, end, start_node_id, batch_size):
+            if limit is not None:
+                if limit <= len(batch):
+                    yield from batch[:limit]
+                    return
+                limit -= len(batch)
+            yield from batch
+
+    def scan_batches(self, start: int, end: int, start_node_id: int = None, batch_size: int = 1000):
+        """Yields the items with hash ∈ [start, end] as lists of about batch_size.
+        If thread safe, each batch is copied under the read lock and the lock
+        of its node, and both are released before it's yielded."""
+
+        # Items left to scan: hash ∈ (cursor, end], remaining keys of the ring
+        cursor = (start - 1) % self.config.hs
+        remaining = self.config.cw_dist(cursor, end) or self.config.hs
+        node = None
+        while True:
+            with self.read_locked():
+                # Node left or lost part of its range since the last batch
+                if node is None or not node.alive or node.id not in self.nodes \
+                        or not self.config.in_range((cursor + 1) % self.config.hs, node.pred.id, node.id):
+                    start_node = self.get_node(start_node_id if node is None else None)
+                    node = start_node.find_successor((cursor + 1) % self.config.hs) if start_node is not None else None
+                    if node is None:
+                        return
+                # Node owns (cursor, node id] of the scanned range
+                owned = self.config.cw_dist(cursor, node.id) or self.config.hs
+                upto = end if owned >= remaining else node.id
+                with node.lock:
+                    batch = node.scan_batch(cursor, upto, batch_size)
+                finished = False
+                if len(batch) >= batch_size and batch[-1][1] != upto:
+                    remaining -= self.config.cw_dist(cursor, batch[-1][1])
+                    cursor = batch[-1][1]
+                elif owned >= remaining:
+                    finished = True
+                else:
+                    remaining -= owned
+                    cursor = node.id
+                    node = node.f_nodes[0] if node.f_nodes[0].alive else node.get_first_alive_succ()
+            if batch:
+                yield batch
+            if finished:
+                return
+
+    @shared
     def knn(self, k: int, node_id: int, start_node_id: int = None) -> list[Node]:
-        """Lists the k nearest nodes of node, given a specific id."""
+        """Lists the k nearest nodes of node, given a specific id.
+        The node itself isn't listed, see knn_key for any id of the ring."""
 
-        neighbours = []
-        
-        node = self.exact_match(key=node_id ,start_node_id=start_node_id)
-        if node.id is None:
+        node = self.exact_match(key=node_id, start_node_id=start_node_id)
+        if node is None:
             return
-
-        next_succ  = node.f_table[0][1]
-        succ_hops = 0
-        next_pred = node.pred
-        pred_hops = 0
-
-        while len(neighbours) < k:
-            # Difference of next_succ and next_pred distance from node
-            succ_pred_difference = (abs(node_id - next_succ.id) % HS) - (abs(node_id - next_pred.id) % HS)
-            
-            # Next successor is closer
-            if succ_pred_difference < 0:
-                neighbours.append(next_succ)
-                next_succ = next_succ.f_table[0][1]
-                succ_hops += 1
-
-            # Next predecessor is closer
-            elif succ_pred_difference > 0:
-                neighbours.append(next_pred)
-                next_pred = next_pred.pred
-                pred_hops += 1
-            
-            # Equal distance
+        succs, preds = self.ring_walk(node, k + 1)
+        # Node is the nearest to its own id
+        return self.merge_nearest(k + 1, node_id, succs, preds)[1:]
+
+    @shared
+    def knn_key(self, k: int, key: int, start_node_id: int = None) -> list[Node]:
+        """Lists the k nodes nearest to key, any id of the ring,
+        by ring distance in either direction. Nearest first.
+        Unlike knn, the node responsible for key is listed too."""
+
+        return self.knn_many(k, [key], start_node_id).get(key, [])
+
+    @shared
+    def knn_many(self, k: int, keys: list[int], start_node_id: int = None) -> dict:
+        """kNN of many keys, visited in ring order. Keys owned by the same
+        node share one lookup and one walk around it.
+        Returns a dictionary key: list of nodes."""
+
+        results = {}
+        node = self.get_node(start_node_id)
+        owner = None
+        for key in sorted(set(keys)):
+            # key ∉ (owner.pred, owner]
+            if owner is None or not self.config.in_range(key, owner.pred.id, owner.id):
+                owner = node.find_successor(key)
+                if owner is None:
+                    print(f"Lookup of key {key} failed.")
+                    continue
+                node = owner
+                succs, preds = self.ring_walk(owner, k)
+            results[key] = self.merge_nearest(k, key, succs, preds)
+        return results
+
+    def ring_walk(self, owner: Node, k: int) -> tuple[list, list]:
+        """Returns up to k alive nodes clockwise from owner (owner included)
+        and up to k counter-clockwise from it. Walks stop if they wrap around."""
+
+        succs = [owner]
+        current = owner
+        while len(succs) < k:
+            current = current.f_nodes[0] if current.f_nodes[0].alive else current.get_first_alive_succ()
+            if current is None or current is owner:
+                break
+            succs.append(current)
+
+        preds = []
+        seen = {owner.id}
+        current = owner.pred
+        while len(preds) < k and current is not None and current.id not in seen:
+            seen.add(current.id)
+            # Skip failed nodes, their pred still leads around the ring
+            if current.alive:
+                preds.append(current)
+            current = current.pred
+        return succs, preds
+
+    def merge_nearest(self, k: int, key: int, succs: list, preds: list) -> list[Node]:
+        """Merges the clockwise and counter-clockwise walks around key,
+        which are both sorted by distance from it, keeping the k nearest."""
+
+        nearest = []
+        chosen = set()
+        i = j = 0
+        while len(nearest) < k and (i < len(succs) or j < len(preds)):
+            succ_dist = self.config.cw_dist(key, succs[i].id) if i < len(succs) else self.config.hs
+            pred_dist = self.config.cw_dist(preds[j].id, key) if j < len(preds) else self.config.hs
+            # Ties go to the successor
+            if succ_dist <= pred_dist:
+                node = succs[i]
+                i += 1
             else:
-                if succ_hops <= pred_hops:
-                    neighbours.append(next_succ)
-                    next_succ = next_succ.f_table[0][1]
-                    succ_hops += 1
-                else:
-                    neighbours.append(next_pred)
-                    next_pred = next_pred.pred
-                    pred_hops += 1
-        
-        return neighbours
-
+                node = preds[j]
+                j += 1
+            # Walks overlap on small rings, keep the nearer occurrence
+            if node.id not in chosen:
+                chosen.add(node.id)
+                nearest.append(node)
+        return nearest
+
+    @shared
     def exact_match(self, key: int, start_node_id: int = None) -> Node  | None:
         """Finds and returns node with id same as a given key, if it exists."""
 
-        node = self.get_node(start_node_id).find_successor(key)
+        start_node = self.get_node(start_node_id)
+        if start_node is None:
+            return
+        node = start_node.find_successor(key)
+        if node is None:
+            print(f"Lookup of key {hex(key)} failed, all successors have failed.")
+            return
         if node.id != key:
             print(f"Couldn't find node with id {key}.")
             return
         return node
 
+    @shared
     def get_random_node(self) -> Node:
         """Returns random node in the network."""
 
-        random_key = random.sample(sorted(self.nodes), 1)[0]
-        return self.nodes[random_key]
+        return self.nodes[random.choice(self.members)]
     
+    @shared
     def get_id_not_in_net(self) -> int:
-        """Returns node id that doesn't already exist in the network."""
-
-        for i in range(HS):
-            if i not in self.nodes:
-                return i
\ No newline at end of file
+        """Returns the smallest node id that doesn't already exist in the network."""
+
+        # Ids are distinct, so sorted_ids[j] ≥ j and the first free id
+        # is the first j with sorted_ids[j] != j
+        lo, hi = 0, len(self.sorted_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sorted_ids[mid] == mid:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.config.hs:
+            return lo
+
+    @shared
+    def random_ids(self, count: int) -> list[int]:
+        """Returns count distinct random ids of the hashing space."""
+
+        # Dense rings: sample the free part of the space
+        if count * 2 > self.config.hs:
+            return random.sample([i for i in range(self.config.hs) if i not in self.nodes], count)
+
+        # random.sample can't take a range longer than sys.maxsize
+        ids = []
+        seen = set()
+        while len(ids) < count:
+            new_id = random.randrange(self.config.hs)
+            if new_id not in seen and new_id not in self.nodes:
+                seen.add(new_id)
+                ids.append(new_id)
+        return ids
\ No newline at end of file
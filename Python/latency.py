@@ -0,0 +1,81 @@
+import math
+import random
+from abc import ABC, abstractmethod
+import numpy as np
+
+class LatencyModel(ABC):
+    """Simulated one-way latency (ms) between nodes, given their ids.
+    candidates is how many nodes of a finger interval proximity neighbour
+    selection looks at before picking the nearest one."""
+
+    def __init__(self, candidates: int = 8) -> None:
+        self.candidates = candidates
+
+    @abstractmethod
+    def latency(self, a: int, b: int) -> float:
+        """One-way latency (ms) from node a to node b."""
+
+    def path_latency(self, path: list[int]) -> float:
+        """Total latency of the hops along a path of node ids."""
+
+        return sum(self.latency(a, b) for a, b in zip(path, path[1:]))
+
+class CoordinateLatency(LatencyModel):
+    """Nodes are placed at random points of a dims-dimensional square of
+    side scale ms, and latency is their Euclidean distance plus a fixed
+    delay per hop. A node's point depends only on seed and its id, so a
+    node keeps it across joins, leaves and snapshot loads."""
+
+    def __init__(self, dims: int = 2, scale: float = 200.0, base: float = 1.0, seed: int = 0,
+                 candidates: int = 8) -> None:
+        super().__init__(candidates)
+        self.dims = dims
+        self.scale = scale
+        self.base = base
+        self.seed = seed
+        # node id: point
+        self.points = {}
+
+    def point(self, node_id: int) -> tuple:
+        if node_id not in self.points:
+            rng = random.Random(f"{self.seed}:{node_id}")
+            self.points[node_id] = tuple(rng.uniform(0, self.scale) for _ in range(self.dims))
+        return self.points[node_id]
+
+    def latency(self, a: int, b: int) -> float:
+        if a == b:
+            return 0.0
+        return math.dist(self.point(a), self.point(b)) + self.base
+
+class MatrixLatency(LatencyModel):
+    """Latencies of a measured matrix, e.g. pairwise pings between hosts.
+    Node ids are mapped to rows with rows (node id: row) if given,
+    else with node id % matrix size."""
+
+    def __init__(self, matrix, rows: dict = None, candidates: int = 8) -> None:
+        super().__init__(candidates)
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Latency matrix must be square, got shape {matrix.shape}")
+        # Lists index faster than numpy arrays one element at a time
+        self.matrix = matrix.tolist()
+        self.size = len(self.matrix)
+        self.rows = rows if rows is not None else {}
+
+    @classmethod
+    def from_file(cls, path: str, rows: dict = None, candidates: int = 8) -> 'MatrixLatency':
+        """Loads a matrix saved with numpy.save (.npy) or as whitespace/comma separated text."""
+
+        if path.endswith(".npy"):
+            return cls(np.load(path), rows, candidates)
+        with open(path) as f:
+            delimiter = "," if "," in f.readline() else None
+        return cls(np.loadtxt(path, delimiter=delimiter), rows, candidates)
+
+    def row(self, node_id: int) -> int:
+        return self.rows.get(node_id, node_id % self.size)
+
+    def latency(self, a: int, b: int) -> float:
+        if a == b:
+            return 0.0
+        return self.matrix[self.row(a)][self.row(b)]
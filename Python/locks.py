@@ -0,0 +1,96 @@
+import threading
+from contextlib import nullcontext
+
+# Lock of objects that aren't shared between threads
+NO_LOCK = nullcontext()
+
+class LockSide:
+    """Context manager taking one side of an RWLock."""
+
+    __slots__ = ["acquire", "release"]
+
+    def __init__(self, acquire, release) -> None:
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+class RWLock:
+    """Readers-writer lock: any number of readers, or one writer.
+    Waiting writers hold new readers back, so writers aren't starved.
+    Reentrant: a reader can read again, a writer can read or write again,
+    but a reader can't become a writer."""
+
+    def __init__(self) -> None:
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.waiting_writers = 0
+        self.writer = None
+        self.write_depth = 0
+        # Per thread: read depth and the side taken by each acquisition, innermost last
+        self.local = threading.local()
+        self.read_side = LockSide(self.acquire_read, self.release)
+        self.write_side = LockSide(self.acquire_write, self.release)
+
+    def read(self) -> LockSide:
+        return self.read_side
+
+    def write(self) -> LockSide:
+        return self.write_side
+
+    def held(self) -> list:
+        if not hasattr(self.local, "sides"):
+            self.local.sides = []
+            self.local.reads = 0
+        return self.local.sides
+
+    def acquire_read(self) -> None:
+        sides = self.held()
+        if self.writer == threading.get_ident():
+            self.write_depth += 1
+            sides.append("write")
+            return
+        if self.local.reads == 0:
+            with self.cond:
+                while self.writer is not None or self.waiting_writers:
+                    self.cond.wait()
+                self.readers += 1
+        self.local.reads += 1
+        sides.append("read")
+
+    def acquire_write(self) -> None:
+        sides = self.held()
+        me = threading.get_ident()
+        if self.writer == me:
+            self.write_depth += 1
+            sides.append("write")
+            return
+        if self.local.reads:
+            raise RuntimeError("A read lock can't be upgraded to a write lock")
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = me
+        self.write_depth = 1
+        sides.append("write")
+
+    def release(self) -> None:
+        if self.held().pop() == "write":
+            self.write_depth -= 1
+            if self.write_depth == 0:
+                with self.cond:
+                    self.writer = None
+                    self.cond.notify_all()
+            return
+        self.local.reads -= 1
+        if self.local.reads == 0:
+            with self.cond:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.cond.notify_all()
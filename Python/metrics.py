@@ -0,0 +1,117 @@
+import json
+from bisect import bisect_left
+from collections import Counter
+from locks import NO_LOCK
+
+# Upper bounds of the default histogram buckets
+BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536]
+
+class Histogram:
+    """Counts observations per bucket (value ≤ bound), plus their count and sum."""
+
+    def __init__(self, buckets: list = BUCKETS) -> None:
+        self.bounds = buckets
+        # Last bucket holds values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple]:
+        """(bound, observations ≤ bound) pairs, ending with ("+Inf", count)."""
+
+        pairs = []
+        total = 0
+        for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+        }
+
+class Metrics:
+    """Opt-in counters and histograms of a network, shared by its nodes.
+    Code records only if the network's metrics aren't None, so disabled
+    metrics cost one attribute check.
+    Histograms: lookup_hops, join_fingers_rewritten, leave_fingers_rewritten,
+    handoff_items. Counters: failed_lookups, cache_hits.
+    node_requests counts the requests each node served: routing steps
+    and the item operations lookups resolved to it."""
+
+    def __init__(self) -> None:
+        self.histograms = {}
+        self.counters = Counter()
+        self.node_requests = Counter()
+        # Replaced by a real lock when the network is thread safe
+        self.lock = NO_LOCK
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+    def request(self, node_id: int) -> None:
+        with self.lock:
+            self.node_requests[node_id] += 1
+
+    def reset(self) -> None:
+        self.histograms = {}
+        self.counters.clear()
+        self.node_requests.clear()
+
+    def request_load(self) -> dict:
+        """Max and mean requests per node that served any."""
+
+        if not self.node_requests:
+            return {"nodes": 0, "mean": 0.0, "max": 0}
+        total = sum(self.node_requests.values())
+        return {
+            "nodes": len(self.node_requests),
+            "mean": total / len(self.node_requests),
+            "max": max(self.node_requests.values()),
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+            "node_requests": {str(node_id): count for node_id, count in self.node_requests.items()},
+            "request_load": self.request_load(),
+        }
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "chord") -> str:
+        """Metrics in the Prometheus text exposition format."""
+
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for bound, count in histogram.cumulative():
+                lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{prefix}_{name}_sum {histogram.sum}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+        if self.node_requests:
+            lines.append(f"# TYPE {prefix}_node_requests_total counter")
+            for node_id, count in sorted(self.node_requests.items()):
+                lines.append(f'{prefix}_node_requests_total{{node="{hex(node_id)}"}} {count}')
+        return "\n".join(lines) + "\n"
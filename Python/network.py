@@ -0,0 +1,347 @@
+import asyncio
+import json
+from time import perf_counter
+from node import Node
+
+HOST = "127.0.0.1"
+# Max size of a single request/response line (bytes)
+LINE_LIMIT = 2**24
+
+class PeerConnection:
+    """Persistent connection to a peer. Requests are pipelined:
+    many can be in flight at once and responses are matched by id."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.next_id = 0
+        self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self) -> None:
+        """Resolves pending requests as their responses arrive."""
+
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self.pending.pop(response["id"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response["result"])
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Peer closed the connection"))
+            self.pending.clear()
+
+    async def call(self, op: str, *args):
+        """Sends a request and waits for its response."""
+
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        request = {"id": self.next_id, "op": op, "args": args}
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing() or self.listener.done()
+
+    async def close(self) -> None:
+        self.writer.close()
+        self.listener.cancel()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+class ConnectionPool:
+    """One persistent connection per peer port, opened on first use."""
+
+    def __init__(self) -> None:
+        # port: task opening (or that opened) the connection
+        self.connections = {}
+
+    async def get(self, port: int) -> PeerConnection:
+        task = self.connections.get(port)
+        if task is not None and task.done() and (task.exception() or task.result().is_closing()):
+            task = None
+        if task is None:
+            # Concurrent callers share the same pending connection
+            task = asyncio.ensure_future(self.open(port))
+            self.connections[port] = task
+        return await task
+
+    async def open(self, port: int) -> PeerConnection:
+        reader, writer = await asyncio.open_connection(HOST, port, limit=LINE_LIMIT)
+        return PeerConnection(reader, writer)
+
+    async def call(self, port: int, op: str, *args):
+        connection = await self.get(port)
+        return await connection.call(op, *args)
+
+    async def drop(self, port: int) -> None:
+        task = self.connections.pop(port, None)
+        if task is not None and task.done() and not task.exception():
+            await task.result().close()
+
+    async def close(self) -> None:
+        for port in list(self.connections):
+            await self.drop(port)
+
+class NodeServer:
+    """Serves one node's routing state and items over TCP."""
+
+    def __init__(self, node: Node, ring: 'NetworkRing') -> None:
+        self.node = node
+        self.ring = ring
+        self.server = None
+        self.port = None
+        self.ops = {
+            "ping": lambda: True,
+            "closest_pre_node": self.closest_pre_node,
+            "successor": self.successor,
+            "successors": self.successors,
+            "get": self.get,
+            "put": self.put,
+            "update": self.update,
+            "delete": self.delete,
+        }
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, HOST, 0, limit=LINE_LIMIT)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers requests of one connection, in the order they arrive.
+        A failed or departed node closes its connections unanswered."""
+
+        try:
+            while line := await reader.readline():
+                if not self.node.alive:
+                    break
+                request = json.loads(line)
+                try:
+                    response = {"id": request["id"], "result": self.ops[request["op"]](*request["args"])}
+                except Exception as e:
+                    response = {"id": request["id"], "error": repr(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def address(self, node: Node) -> list:
+        return [node.id, self.ring.ports[node.id]]
+
+    def closest_pre_node(self, key: int) -> list:
+        return self.address(self.node.closest_pre_node(key))
+
+    def successor(self) -> list | None:
+        succ = self.node.f_nodes[0]
+        if not succ.alive:
+            succ = self.node.get_first_alive_succ()
+        return self.address(succ) if succ is not None else None
+
+    def successors(self) -> list:
+        """Addresses of the alive nodes of the successor list."""
+
+        return [self.address(succ) for succ in self.node.succ_list
+                if succ is not None and succ.alive and succ.id in self.ring.ports]
+
+    # Item operations go through the Interface, like its own, so
+    # replicas, quorums and the node lock are handled the same way
+
+    def get(self, key: str):
+        return self.ring.interface.get_at(self.node, key)
+
+    def put(self, key: str, key_hash: int, value) -> bool:
+        self.ring.interface.insert_at(self.node, (key, value), key_hash)
+        return True
+
+    def update(self, key: str, value) -> bool:
+        return self.ring.interface.update_at(self.node, (key, value), self.ring.config.hash_func(key))
+
+    def delete(self, key: str) -> bool:
+        return self.ring.interface.delete_at(self.node, key, self.ring.config.hash_func(key))
+
+class NetworkRing:
+    """Runs every node of an Interface as a TCP peer on 127.0.0.1.
+    Membership changes still go through the Interface, call sync()
+    afterwards to start/stop the matching servers."""
+
+    def __init__(self, interface) -> None:
+        self.interface = interface
+        self.config = interface.config
+        self.servers = {}
+        # node id: port
+        self.ports = {}
+        self.pool = ConnectionPool()
+
+    async def start(self) -> None:
+        await self.sync()
+
+    async def sync(self) -> None:
+        """Starts servers for joined nodes and stops those of departed ones."""
+
+        for node_id in list(self.servers):
+            if node_id not in self.interface.nodes:
+                server = self.servers.pop(node_id)
+                await self.pool.drop(server.port)
+                await server.stop()
+                del self.ports[node_id]
+        for node_id, node in self.interface.nodes.items():
+            if node_id not in self.servers:
+                server = NodeServer(node, self)
+                await server.start()
+                self.servers[node_id] = server
+                self.ports[node_id] = server.port
+
+    async def stop(self) -> None:
+        await self.pool.close()
+        for server in self.servers.values():
+            await server.stop()
+        self.servers = {}
+        self.ports = {}
+
+    async def find_successor(self, key: int, start_node_id: int = None) -> tuple[list | None, int]:
+        """Iterative lookup: asks each node for its closest preceding
+        finger until none is closer to key, then for its successor.
+        A node that doesn't answer (failed or left) is replaced by the first
+        other node of the previous node's successor list.
+        Returns ([node id, port], hops), the address is None if the lookup failed."""
+
+        start_node = self.interface.get_node(start_node_id)
+        path = [[start_node.id, self.ports[start_node.id]]]
+        failed = set()
+        hops = 0
+        while True:
+            current = path[-1]
+            try:
+                next = await self.pool.call(current[1], "closest_pre_node", key)
+                if next[0] == current[0]:
+                    if current[0] == key:
+                        return current, hops
+                    return await self.pool.call(current[1], "successor"), hops + 1
+            except ConnectionError:
+                failed.add(current[1])
+                path.pop()
+                next = await self.next_alive(path, failed)
+                if next is None:
+                    return None, hops
+            path.append(next)
+            hops += 1
+
+    async def next_alive(self, path: list, failed: set) -> list | None:
+        """First node of the successor list of the last node of path that
+        hasn't failed. None if there's none, or path is empty."""
+
+        while path:
+            try:
+                for succ in await self.pool.call(path[-1][1], "successors"):
+                    if succ[1] not in failed:
+                        return succ
+                return
+            except ConnectionError:
+                failed.add(path.pop()[1])
+
+    async def find_responsible(self, key_hash: int, start_node_id: int = None) -> int | None:
+        """Port of the node responsible for key_hash, served from the lookup
+        cache when possible. Records the lookup like Interface.find_responsible."""
+
+        interface = self.interface
+        if interface.cache is not None:
+            node = interface.cache.get(key_hash)
+            if node is not None and node.id in self.ports:
+                interface.record_lookup(node, 1, cached=True)
+                return self.ports[node.id]
+        address, hops = await self.find_successor(key_hash, start_node_id)
+        node = interface.nodes.get(address[0]) if address is not None else None
+        interface.record_lookup(node, hops)
+        if node is None:
+            print(f"Lookup of key {hex(key_hash)} failed, all successors have failed.")
+            return
+        if interface.cache is not None:
+            interface.cache.put(node)
+        return address[1]
+
+    async def insert_item(self, new_item: tuple, start_node_id: int = None) -> None:
+        """Inserts an item (key, value) to the correct node of the network."""
+
+        key_hash = self.config.hash_func(new_item[0])
+        port = await self.find_responsible(key_hash, start_node_id)
+        if port is not None:
+            await self.pool.call(port, "put", new_item[0], key_hash, new_item[1])
+
+    async def get_item(self, key: str, start_node_id: int = None):
+        """Returns the value of key, None if it's not found."""
+
+        port = await self.find_responsible(self.config.hash_func(key), start_node_id)
+        if port is not None:
+            return await self.pool.call(port, "get", key)
+
+    async def update_record(self, new_item: tuple, start_node_id: int = None) -> None:
+        """Updates the record (value) of an item given its key."""
+
+        port = await self.find_responsible(self.config.hash_func(new_item[0]), start_node_id)
+        if port is not None and not await self.pool.call(port, "update", new_item[0], new_item[1]):
+            print(f"Could not find item with key {new_item[0]}")
+
+    async def delete_item(self, key: str, start_node_id: int = None) -> None:
+        """Finds node responsible for key and removes the (key, value) entry from it."""
+
+        port = await self.find_responsible(self.config.hash_func(key), start_node_id)
+        if port is not None and not await self.pool.call(port, "delete", key):
+            print(f"Key {key} not found")
+
+    async def exact_match(self, key: int, start_node_id: int = None) -> int | None:
+        """Returns the id of the node with id same as a given key, if it exists."""
+
+        address, _ = await self.find_successor(key, start_node_id)
+        if address is None:
+            print(f"Lookup of key {hex(key)} failed, all successors have failed.")
+            return
+        if address[0] != key:
+            print(f"Couldn't find node with id {key}.")
+            return
+        return address[0]
+
+    async def measure_lookups(self, keys: list[int], concurrency: int = 1, start_node_id: int = None) -> dict:
+        """Runs lookups with up to concurrency requests in flight.
+        Returns throughput and per-lookup/per-hop latency."""
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        hops = []
+
+        async def lookup(key: int) -> None:
+            async with semaphore:
+                start = perf_counter()
+                _, hop_count = await self.find_successor(key, start_node_id)
+                latencies.append(perf_counter() - start)
+                hops.append(hop_count)
+
+        start = perf_counter()
+        await asyncio.gather(*(lookup(key) for key in keys))
+        elapsed = perf_counter() - start
+
+        # Every lookup does one request per hop plus the final one
+        requests = sum(hops) + len(hops)
+        return {
+            "lookups": len(keys),
+            "concurrency": concurrency,
+            "seconds": elapsed,
+            "throughput": len(keys) / elapsed if elapsed else 0.0,
+            "mean_hops": sum(hops) / len(hops) if hops else 0.0,
+            "mean_latency_ms": sum(latencies) * 1000 / len(latencies) if latencies else 0.0,
+            "request_latency_ms": sum(latencies) * 1000 / requests if requests else 0.0,
+        }
@@ -1,215 +1,614 @@
 from xmlrpc.client import boolean
-from main import KS, HS, SLS
-import hashlib
-
-def hash_func(data) -> int:
-    hash_out = hashlib.sha1()
-    hash_out.update(bytes(data.encode("utf-8")))
-    return int(hash_out.hexdigest(), 16) % HS
-
-def cw_dist(k1: int, k2: int) -> int:
-    """Clockwise distance of 2 keys"""
-    
-    if k1 <= k2:
-        return k2 - k1
-    else:
-        return (HS) + (k2 - k1)
-
-def comp_cw_dist(k1: int, k2: int, dest: int) -> bool:
-    """Returns true if clockwise distance of k1 from dest
-    is bigger than clockwise distance of k2 from dest.
-    In other words, k2 ∈ (k1, dest]"""
-
-    if cw_dist(k1, dest) > cw_dist(k2, dest):
-        return True
-    return False
+from config import RingConfig
+from storage import LogStore
+from locks import NO_LOCK
+from bisect import bisect_left, bisect_right
+
+class ItemIndex:
+    """Node's item keys sorted by their position (hash) on the ring."""
+
+    def __init__(self) -> None:
+        # Parallel lists, sorted by hash
+        self.hashes = []
+        self.keys = []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, key_hash: int, key: str) -> None:
+        pos = bisect_right(self.hashes, key_hash)
+        self.hashes.insert(pos, key_hash)
+        self.keys.insert(pos, key)
+
+    def remove(self, key_hash: int, key: str) -> None:
+        pos = bisect_left(self.hashes, key_hash)
+        pos += self.keys[pos:bisect_right(self.hashes, key_hash)].index(key)
+        del self.hashes[pos]
+        del self.keys[pos]
+
+    def range_slices(self, start: int, end: int) -> list[tuple]:
+        """Returns the (lo, hi) index slices of the keys with
+        hash ∈ (start, end]. If start == end the whole ring is covered."""
+
+        lo = bisect_right(self.hashes, start)
+        hi = bisect_right(self.hashes, end)
+        if start < end:
+            return [(lo, hi)]
+        # Range wraps around zero
+        return [(lo, len(self.hashes)), (0, hi)]
+
+    def pop_range(self, start: int, end: int) -> tuple[list, list]:
+        """Removes and returns (hashes, keys) with hash ∈ (start, end], in ring order."""
+
+        hashes, keys = [], []
+        for lo, hi in self.range_slices(start, end):
+            hashes.extend(self.hashes[lo:hi])
+            keys.extend(self.keys[lo:hi])
+        # Delete the slice furthest back first so the other stays valid
+        for lo, hi in sorted(self.range_slices(start, end), reverse=True):
+            del self.hashes[lo:hi]
+            del self.keys[lo:hi]
+        return hashes, keys
+
+    def merge(self, hashes: list, keys: list) -> None:
+        """Adds (hashes, keys) sorted by hash, or in ring order, to the index."""
+
+        hashes = self.hashes + hashes
+        keys = self.keys + keys
+        # Inputs are at most a few sorted runs, which sorted() merges in linear time
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        self.hashes = [hashes[i] for i in order]
+        self.keys = [keys[i] for i in order]
 
 class Node:
-    def __init__(self, id: int, pred=None) -> None:
+    # Fixed attributes keep per-node memory down on big rings
+    __slots__ = ["id", "config", "items", "item_hashes", "index", "replicas", "f_pos", "f_ids",
+                 "f_nodes", "pred", "cache", "metrics", "latency", "host", "next_finger", "alive", "succ_list", "lock"]
+
+    def __init__(self, id: int, config: RingConfig, pred=None) -> None:
         self.id = id
+        self.config = config
         # List of dictionaries
         self.items = {}
-        # list(table) of lists of the form: [position, node]
-        self.f_table = []
+        # Cached key hashes and keys sorted by hash
+        self.item_hashes = {}
+        self.index = ItemIndex()
+        # Copies of predecessors' items, key: (hash, value)
+        self.replicas = {}
+        # Finger table as parallel lists: positions, successor ids, successor nodes
+        self.f_pos = [(id + 2**i) % config.hs for i in range(config.ks)]
+        self.f_ids = [None] * config.ks
+        self.f_nodes = [None] * config.ks
         self.pred = pred
-        self.succ_list = [None for r in range(SLS)]
+        # Lookup cache shared by the network, if any
+        self.cache = None
+        # Metrics shared by the network, if enabled
+        self.metrics = None
+        # Latency model shared by the network, if fingers are picked by proximity
+        self.latency = None
+        # Physical host, if the node is one of its virtual nodes
+        self.host = None
+        # Next finger refreshed by fix_next_finger
+        self.next_finger = 1
+        # False once the node has left the network or failed
+        self.alive = True
+        self.succ_list = [None for r in range(config.sls)]
+        # Held while changing or reading items in a thread-safe network
+        self.lock = NO_LOCK
+
+    def set_finger(self, i: int, node: 'Node') -> None:
+        """Points finger table entry i to node."""
+
+        self.f_ids[i] = node.id
+        self.f_nodes[i] = node
+
+    def pns_finger(self, i: int, succ: 'Node') -> 'Node':
+        """Proximity neighbour selection: any node ∈ [position i, position i + 1)
+        is a correct finger i. Returns the nearest of succ, the first node of
+        the interval, and the successors following it in the interval.
+        Returns succ if there's no latency model."""
+
+        if self.latency is None or i == 0 or succ is None:
+            return succ
+        start = self.f_pos[i]
+        # Last finger's interval ends at this node
+        span = self.config.cw_dist(start, self.f_pos[i + 1] if i + 1 < self.config.ks else self.id)
+        best, best_latency = succ, self.latency.latency(self.id, succ.id)
+        candidate = succ.f_nodes[0]
+        for _ in range(self.latency.candidates - 1):
+            # candidate ∉ [position i, position i + 1)
+            if candidate is None or candidate is succ or self.config.cw_dist(start, candidate.id) >= span:
+                break
+            if candidate.alive:
+                latency = self.latency.latency(self.id, candidate.id)
+                if latency < best_latency:
+                    best, best_latency = candidate, latency
+            candidate = candidate.f_nodes[0]
+        return best
+
+    def select_fingers(self) -> None:
+        """Replaces fingers 1.. by the nearest node of their interval.
+        Assumes fingers point to the first node of their interval."""
+
+        for i in range(1, self.config.ks):
+            self.set_finger(i, self.pns_finger(i, self.f_nodes[i]))
 
     def closest_pre_node(self, key: int) -> 'Node':
         """Returns the last predecessor from THIS node's finger table"""
 
-        current = self
-        for i in range(KS):
-            # current.successor ∈ (current, key]
-            if comp_cw_dist(current.id, current.f_table[i][1].id, key):
-                current = current.f_table[i][1]
-        return current
+        hs = self.config.hs
+        dist = (key - self.id) % hs
+        f_ids = self.f_ids
+        # Last finger whose position is ∈ (self, key]
+        i = min(dist.bit_length(), self.config.ks) - 1
+        while i >= 0:
+            # finger ∈ (self, key]
+            if 0 < (f_ids[i] - self.id) % hs <= dist:
+                if self.f_nodes[i].alive:
+                    return self.f_nodes[i]
+                # Dead finger: repair it and look at it again
+                if self.repair_finger(i):
+                    continue
+            i -= 1
+        return self
+
+    def repair_finger(self, i: int) -> bool:
+        """Points dead finger i to the first alive successor, until
+        fix_fingers finds the proper one. Returns false if there's none."""
+
+        succ = self.get_first_alive_succ()
+        if succ is None:
+            return False
+        self.set_finger(i, succ)
+        return True
 
     def find_successor(self, key: int) -> 'Node':
         """Returns the node with the shortest
         clockwise distance from the given key"""
 
-        current = self.closest_pre_node(key)
-        next = current.closest_pre_node(key)
+        return self.find_successor_hops(key)[0]
 
-        while comp_cw_dist(current.id, next.id, key):
+    def find_successor_hops(self, key: int) -> tuple['Node', int]:
+        """Same as find_successor, also returns the number of hops.
+        The node is None if all nodes of the successor list failed."""
+
+        if self.metrics is not None:
+            # Count a request for every node asked
+            metrics = self.metrics
+            path = self.find_successor_path(key, lambda node: metrics.request(node.id))
+            return path[-1], len(path) - 1
+
+        hops = 0
+        current = self
+        next = current.closest_pre_node(key)
+        # closest_pre_node only returns nodes ∈ (current, key]
+        while next is not current:
             current = next
             next = current.closest_pre_node(key)
+            hops += 1
 
         if current.id == key:
-            return current
+            return current, hops
+        succ = current.f_nodes[0]
+        if not succ.alive:
+            succ = current.get_first_alive_succ()
+        return succ, hops + 1
+
+    def find_successor_path(self, key: int, visit=None) -> list['Node']:
+        """Same as find_successor, returns every node the lookup went
+        through: this node first, the responsible node (or None) last.
+        visit, if given, is called with every node asked, before asking it."""
+
+        if visit is not None:
+            visit(self)
+        path = [self]
+        current = self
+        next = current.closest_pre_node(key)
+        # closest_pre_node only returns nodes ∈ (current, key]
+        while next is not current:
+            current = next
+            path.append(current)
+            if visit is not None:
+                visit(current)
+            next = current.closest_pre_node(key)
 
-        return current.f_table[0][1]
+        if current.id == key:
+            return path
+        succ = current.f_nodes[0]
+        if not succ.alive:
+            succ = current.get_first_alive_succ()
+        path.append(succ)
+        return path
 
     def fix_fingers(self) -> None:
         """Called periodically.
         Refreshes finger table entries."""
 
-        for i in range(KS - 1):
-            next_in_finger = self.f_table[i + 1]
-            next_in_finger[1] = self.f_table[i][1].find_successor(next_in_finger[0])
+        for i in range(self.config.ks - 1):
+            start = self.f_nodes[i] if self.f_nodes[i].alive else self
+            succ = start.find_successor(self.f_pos[i + 1])
+            # Keep the old entry if the lookup failed
+            if succ is not None:
+                self.set_finger(i + 1, self.pns_finger(i + 1, succ))
         #self.print_node()
 
-    def fix_successor_list(self) -> None:
+    def fix_next_finger(self) -> bool:
+        """Called periodically.
+        Refreshes one finger table entry per call, round robin.
+        Returns true if the entry changed."""
+
+        i = self.next_finger
+        self.next_finger = i + 1 if i + 1 < self.config.ks else 1
+        succ = self.pns_finger(i, self.find_successor(self.f_pos[i]))
+        if succ is None or succ is self.f_nodes[i]:
+            return False
+        self.set_finger(i, succ)
+        return True
+
+    def stabilize(self) -> bool:
         """Called periodically.
-        Refreshes successor list."""
+        Adopts successor's predecessor as successor if it sits between them,
+        then notifies the successor. Returns true if anything changed."""
 
-        next_successor = self
-        for i in range(SLS):
-            if next_successor.f_table[0][1] == self:
+        succ = self.f_nodes[0]
+        changed = False
+        if not succ.alive:
+            succ = self.get_first_alive_succ()
+            if succ is None:
+                return False
+            self.set_finger(0, succ)
+            changed = True
+        x = succ.pred
+        # x ∈ (self, successor)
+        if x is not None and x.alive and x is not succ and self.config.in_range(x.id, self.id, succ.id):
+            self.set_finger(0, x)
+            succ = x
+            changed = True
+        return succ.notify(self) or changed
+
+    def notify(self, node: 'Node') -> bool:
+        """node thinks it might be this node's predecessor.
+        Returns true if it was adopted."""
+
+        if node is self or node is self.pred:
+            return False
+        # node ∈ (predecessor, self) or predecessor failed
+        if self.pred is None or not self.pred.alive or self.config.in_range(node.id, self.pred.id, self.id):
+            self.pred = node
+            if self.cache is not None:
+                self.cache.invalidate(self.id)
+            # Range may have grown over a failed predecessor's
+            if self.promote_replicas():
+                self.rereplicate()
+            return True
+        return False
+
+    def fix_successor_list(self) -> bool:
+        """Called periodically.
+        Refreshes successor list. Returns true if it changed."""
+
+        old_list = self.succ_list
+        succ_list = []
+        next_successor = self.f_nodes[0]
+        dist = 0
+        # Follow successors, skipping failed ones, until back at this node
+        while len(succ_list) < self.config.sls and next_successor is not self:
+            next_dist = self.config.cw_dist(self.id, next_successor.id)
+            # A stale pointer jumped past this node
+            if next_dist <= dist:
                 break
-            self.succ_list[i] = next_successor.f_table[0][1]
-            next_successor = next_successor.f_table[0][1]
+            dist = next_dist
+            if next_successor.alive:
+                succ_list.append(next_successor)
+            next_successor = next_successor.f_nodes[0]
+        old_holders = self.replica_holders()[1:]
+        # Ring may be smaller than the list
+        self.succ_list = succ_list + [None] * (self.config.sls - len(succ_list))
+        if self.succ_list == old_list:
+            return False
+        self.rereplicate(old_holders)
+        # Nodes that stopped holding copies of this node's items drop them,
+        # so they can't bring back deleted or outdated items later
+        holders = self.replica_holders()
+        for holder in old_holders:
+            if holder not in holders:
+                holder.drop_replicas(self.pred.id, self.id)
+        return True
 
-    def insert_new_pred(self, new_n: 'Node') -> None:
+    def insert_new_pred(self, new_n: 'Node', maintain: bool = True) -> int:
         """Inserts new node to the network as this node's predecessor.
-        Also updates neighboring nodes and necessary finger tables."""
+        Also updates neighboring nodes and, if maintain, necessary finger
+        tables; otherwise they are left to periodic stabilization.
+        Returns the number of finger table entries rewritten."""
                 
         #print("Predecessor node BEFORE node join:")
         #self.pred.print_node(items_print=True)
 
-        # New node's successor is this node
-        new_n.f_table.append([(new_n.id + 1) % (HS), self])
+        # New node's successor is this node. Until the finger table is
+        # initialized, every finger points to it.
+        for i in range(self.config.ks):
+            new_n.set_finger(i, self)
         # Predecessor's new successor is the new node
-        self.pred.f_table[0][1] = new_n
+        self.pred.set_finger(0, new_n)
         # New node's predecessor is this node's predecessor
         new_n.pred = self.pred
         # This node's predecessor is the new node
         self.pred = new_n
+        # This node no longer owns (previous predecessor, new node]
+        if self.cache is not None:
+            self.cache.invalidate(self.id)
 
         self.move_items_to_pred()
         new_n.initialize_finger_table()
         new_n.fix_successor_list()
-        new_n.update_necessary_fingers(joinning=True)
+        # This node's last replica holders don't hold the new node's range
+        new_holders = new_n.replica_holders()
+        for holder in self.replica_holders()[1:]:
+            if holder not in new_holders:
+                holder.drop_replicas(new_n.pred.id, new_n.id)
+        touched = new_n.update_necessary_fingers(joinning=True) if maintain else 0
                         
         #print("Predecessor node AFTER node join:")
         #new_n.pred.print_node(items_print=True)
+        return touched
 
-    def insert_item_to_node(self, new_item: tuple, print_item=False) -> None:
+    def insert_item_to_node(self, new_item: tuple, print_item=False, key_hash: int = None) -> None:
         """Insert data in the node."""
         
         if print_item:
             print(f"Item with key {new_item[0]} before updating record:\n{self.items[new_item[0]]}")
+        if new_item[0] not in self.items:
+            if key_hash is None:
+                key_hash = self.config.hash_func(new_item[0])
+            self.item_hashes[new_item[0]] = key_hash
+            self.index.add(key_hash, new_item[0])
+            # An older copy from a failed predecessor is outdated now
+            self.replicas.pop(new_item[0], None)
         self.items[new_item[0]] = new_item[1]
         if print_item:
             print(f"Item with key {new_item[0]} after updating record:\n{self.items[new_item[0]]}")
 
+    def insert_items_to_node(self, hashes: list[int], keys: list[str], values: list) -> None:
+        """Inserts items, already sorted by hash, in the node."""
+
+        new_hashes, new_keys = [], []
+        for key_hash, key, value in zip(hashes, keys, values):
+            if key not in self.items:
+                self.item_hashes[key] = key_hash
+                new_hashes.append(key_hash)
+                new_keys.append(key)
+            self.items[key] = value
+        self.index.merge(new_hashes, new_keys)
+
+    def index_items(self) -> None:
+        """Rebuilds item hashes and the sorted index from the item keys,
+        e.g. after the items were reopened from disk."""
+
+        self.item_hashes = {key: self.config.hash_func(key) for key in self.items}
+        owned = sorted((key_hash, key) for key, key_hash in self.item_hashes.items())
+        self.index = ItemIndex()
+        self.index.hashes = [key_hash for key_hash, _ in owned]
+        self.index.keys = [key for _, key in owned]
+
     def delete_item_from_node(self, key: str, item_print: bool = False) -> None:
         if key in self.items:
             if item_print:
                 print(f"Node before removing item with key {key}:")
                 self.print_node(items_print=True)
             del(self.items[key])
+            self.index.remove(self.item_hashes.pop(key), key)
             if item_print:
                 print(f"Node after removing item with key {key}:")
                 self.print_node(items_print=True)
             return
         print(f"Key {key} not found") 
 
-    def move_items_to_pred(self) -> None:    
+    def move_items_to(self, node: 'Node', start: int, end: int) -> int:
+        """Moves items with hash ∈ (start, end] to node.
+        Returns the number of items moved."""
+
+        hashes, keys = self.index.pop_range(start, end)
+        if self.metrics is not None:
+            self.metrics.observe("handoff_items", len(keys))
+        if isinstance(self.items, LogStore) and isinstance(node.items, LogStore):
+            # Log records move in bulk, values aren't decoded
+            self.items.move_to(node.items, keys)
+            for key in keys:
+                node.item_hashes[key] = self.item_hashes.pop(key)
+                node.replicas.pop(key, None)
+        else:
+            for key in keys:
+                node.items[key] = self.items.pop(key)
+                node.item_hashes[key] = self.item_hashes.pop(key)
+                node.replicas.pop(key, None)
+        node.index.merge(hashes, keys)
+        return len(keys)
+
+    def replica_holders(self) -> list['Node']:
+        """Returns this node and the alive successors that keep copies of its items."""
+
+        holders = [self]
+        for succ in self.succ_list:
+            if len(holders) >= self.config.replication:
+                break
+            if succ is not None and succ.alive:
+                holders.append(succ)
+        return holders
+
+    def get_local(self, key: str, default=None):
+        """Returns key's value from this node's items or replicas."""
+
+        if key in self.items:
+            return self.items[key]
+        if key in self.replicas:
+            return self.replicas[key][1]
+        return default
+
+    def claim_item(self, key: str) -> bool:
+        """Returns true if key is one of this node's items. Lookups found this
+        node responsible for key, so a replica of it is promoted first: its
+        owner failed and stabilization hasn't promoted it yet."""
+
+        if key in self.items:
+            return True
+        if key not in self.replicas:
+            return False
+        key_hash, value = self.replicas.pop(key)
+        self.insert_item_to_node((key, value), key_hash=key_hash)
+        return True
+
+    def drop_replicas(self, start: int, end: int, keep=()) -> int:
+        """Removes replicas with hash ∈ (start, end] whose key isn't in keep.
+        Returns the number of replicas removed."""
+
+        stale = [key for key, (key_hash, _) in self.replicas.items()
+                 if key not in keep and self.config.in_range(key_hash, start, end)]
+        for key in stale:
+            del self.replicas[key]
+        return len(stale)
+
+    def promote_replicas(self) -> int:
+        """Turns replicas with hash ∈ (predecessor, self] into items.
+        Replicas of keys that are already items are outdated and dropped.
+        Returns the number of items promoted."""
+
+        owned = sorted((key_hash, key) for key, (key_hash, _) in self.replicas.items()
+                       if self.config.in_range(key_hash, self.pred.id, self.id))
+        for key_hash, key in owned:
+            if key in self.items:
+                del self.replicas[key]
+        owned = [(key_hash, key) for key_hash, key in owned if key in self.replicas]
+        if not owned:
+            return 0
+        hashes = [key_hash for key_hash, _ in owned]
+        keys = [key for _, key in owned]
+        self.insert_items_to_node(hashes, keys, [self.replicas.pop(key)[1] for key in keys])
+        return len(keys)
+
+    def rereplicate(self, old_holders: list = None) -> None:
+        """Copies this node's items to its current replica holders. Holders
+        drop their copies of keys in this node's range it no longer has.
+        Holders in old_holders (every holder if None) got every write, so
+        only the keys they're missing are copied. Other holders may hold
+        outdated copies and get the whole range again."""
+
+        if self.config.replication < 2:
+            return
+        self.promote_replicas()
+        for holder in self.replica_holders()[1:]:
+            replicas = holder.replicas
+            if old_holders is None or holder in old_holders:
+                holder.drop_replicas(self.pred.id, self.id, self.items)
+                keys = [key for key in self.items if key not in replicas]
+            else:
+                holder.drop_replicas(self.pred.id, self.id)
+                keys = self.items
+            for key in keys:
+                replicas[key] = (self.item_hashes[key], self.items[key])
+
+    def move_items_to_pred(self) -> int:    
         """Moves node's items to predecessor.
         Used after a new node joins the network.
         Assumes all predecessors are up to date."""
 
-        for key in sorted(self.items):
-            # key ∉ (previous predecessor, new node (current predecessor)]
-            if not comp_cw_dist(self.pred.pred.id, hash_func(key), self.pred.id):
-                break
-            self.pred.items[key] = self.items[key]
-            del self.items[key]
+        # key ∈ (previous predecessor, new node (current predecessor)]
+        return self.move_items_to(self.pred, self.pred.pred.id, self.pred.id)
 
     def initialize_finger_table(self) -> None:
         """Initialize node's finger table.
         Assumes node's successor is up to date."""
 
-        i = 1
-        while i < KS:
-            pos = (self.id + (2**i)) % (HS)
-
-            # While pos ∈ (new_n.id, new_n.successor]
-            while (i < KS) and comp_cw_dist(self.id, pos, self.f_table[0][1].id):
+        succ = self.f_nodes[0]
+        for i in range(1, self.config.ks):
+            pos = self.f_pos[i]
+            # pos ∈ (new_n.id, new_n.successor]
+            if self.config.comp_cw_dist(self.id, pos, succ.id):
                 # new_n [i] = new_n.successor
-                self.f_table.append([pos, self.f_table[0][1]])
-                i += 1
-                pos = (self.id + (2**i)) % (HS)
+                self.set_finger(i, self.pns_finger(i, succ))
+            else:
+                self.set_finger(i, self.pns_finger(i, succ.find_successor(pos) or succ))
 
-            if i == KS:
-                break
-
-            self.f_table.append([pos, self.f_table[0][1].find_successor(pos)])
-            i += 1
-
-    def leave(self) -> None:
-        """Removes node from the network."""
+    def leave(self, maintain: bool = True) -> int:
+        """Removes node from the network. If maintain, necessary finger
+        tables are updated now; otherwise by periodic stabilization.
+        Returns the number of finger table entries rewritten."""
 
+        self.alive = False
+        succ = self.f_nodes[0]
         # Move all keys to successor node
-        self.f_table[0][1].items = self.f_table[0][1].items | self.items
+        self.move_items_to(succ, self.id, self.id)
         # Update successor's predecessor
-        self.f_table[0][1].pred = self.pred
+        succ.pred = self.pred
         # Update predecessor's successor
-        self.pred.f_table[0][1] = self.f_table[0][1]
-
-        self.update_necessary_fingers()
+        self.pred.set_finger(0, succ)
+        # Successor now owns this node's range as well
+        if self.cache is not None:
+            self.cache.invalidate(self.id)
+            self.cache.invalidate(succ.id)
+        succ.rereplicate()
+
+        return self.update_necessary_fingers() if maintain else 0
     
-    def calc_furth_poss_pred(self) -> int:
-        """Calculates the furthest possible predecessor id whose 
-        last finger table entry position is equal to or higher
-        than the current node's ID."""
-
-        if self.id >= 2**(KS-1):
-            return self.id - (2**(KS-1))
-
-        return 2**KS + (self.id-(2**(KS-1)))
-
-    def update_necessary_fingers(self, joinning = False) -> None:
-        """Updates necessary finger tables on node join/leave"""
-
-        furthest_possible_pred_id = self.calc_furth_poss_pred()
+    def finger_range(self, i: int) -> tuple[int, int]:
+        """Returns the range (start, end] of node ids whose
+        i-th finger position is ∈ (predecessor, current node]."""
+
+        return (self.pred.id - 2**i) % self.config.hs, (self.id - 2**i) % self.config.hs
+
+    def update_necessary_fingers(self, joinning = False) -> int:
+        """Updates necessary finger tables on node join/leave.
+        Only entries whose position is ∈ (predecessor, current node]
+        change owner, so only those are patched. With proximity neighbour
+        selection, a leaving node may also be the finger of entries whose
+        position is before its predecessor; those are picked again.
+        Returns the number of finger table entries rewritten."""
+
+        if self.pred == self or self.pred is None:
+            return 0
+
+        # Owner of (predecessor, current node] from now on
+        new_owner = self if joinning else self.f_nodes[0]
+        pns_leave = not joinning and self.latency is not None
+        touched = 0
+        for i in range(self.config.ks):
+            start, end = self.finger_range(i)
+            walk_start = start
+            # Finger i of ids ∈ (current node - 2^(i+1), current node - 2^i]
+            # may point to the leaving node, if that's longer than (start, end]
+            if pns_leave and i > 0 and self.config.cw_dist(self.pred.id, self.id) < 2**i:
+                walk_start = (self.id - 2**(i + 1)) % self.config.hs
+            first = new_owner.find_successor((walk_start + 1) % self.config.hs)
+            if first is None:
+                continue
+            next_node = first
+            # next_node.id ∈ (walk_start, end]
+            while self.config.in_range(next_node.id, walk_start, end):
+                # A leaving node's own table doesn't matter
+                if next_node is not self or joinning:
+                    finger = next_node.f_nodes[i]
+                    # next_node.id ∈ (start, end]
+                    if self.config.in_range(next_node.id, start, end):
+                        finger = next_node.pns_finger(i, new_owner)
+                    elif finger is self:
+                        succ = next_node.find_successor(next_node.f_pos[i])
+                        if succ is not None:
+                            finger = next_node.pns_finger(i, succ)
+                    if next_node.f_nodes[i] is not finger:
+                        next_node.set_finger(i, finger)
+                        touched += 1
+                next_node = next_node.f_nodes[0]
+                if next_node is first:
+                    break
+
+        # Predecessors whose successor list includes (or included) this node
         next_pred = self.pred
-        if next_pred == self or next_pred is None:
-            return
-
-        i = 0
-        # next_pred.id ∈ (furthest_possible_pred_id, self]
-        while comp_cw_dist(furthest_possible_pred_id, next_pred.id, self.id):
-            next_pred.fix_fingers()
-            if i < SLS:
-                next_pred.fix_successor_list()
-                i += 1
+        for i in range(self.config.sls):
+            if next_pred is self:
+                break
+            next_pred.fix_successor_list()
             next_pred = next_pred.pred
-            if next_pred == self or next_pred is None:
-                return
-            
-        if not joinning:
-            comp = self
-        else:
-            comp = self.f_table[0][1]
 
-        # next_pred last = current node
-        while next_pred.f_table[KS-1][1] == comp:
-            next_pred.fix_fingers()
-            next_pred = next_pred.pred
-            if next_pred == self or next_pred is None:
-                return
+        return touched
 
     def print_node(self, items_print = False, finger_print = False) -> None:
         print(f"Node ID: {hex(self.id)}")
@@ -219,8 +618,8 @@ class Node:
             print(f"Items in node: {[key for key in self.items.keys()]}")
         if finger_print:
             print("Finger table:")
-            for entry in self.f_table:
-                print(f"{hex(entry[0])} -> {hex(entry[1].id)}")
+            for pos, succ_id in zip(self.f_pos, self.f_ids):
+                print(f"{hex(pos)} -> {hex(succ_id)}")
         print()
 
     def print_succ(self):
@@ -231,10 +630,27 @@ class Node:
             true_succ.append(hex(succ.id))
         print(f"Successor list: {true_succ}")
     
+    def scan_batch(self, start: int, end: int, batch_size: int) -> list:
+        """Returns up to batch_size (key, hash, value) of the items with
+        hash ∈ (start, end], in ring order. Items sharing the last hash
+        are all returned, so the next batch can start after that hash."""
+
+        index = self.index
+        batch = []
+        for lo, hi in index.range_slices(start, end):
+            if len(batch) >= batch_size:
+                break
+            stop = min(hi, lo + batch_size - len(batch))
+            while stop < hi and index.hashes[stop] == index.hashes[stop - 1]:
+                stop += 1
+            batch.extend((key, key_hash, self.items[key])
+                         for key, key_hash in zip(index.keys[lo:stop], index.hashes[lo:stop]))
+        return batch
+
     def get_first_alive_succ(self) -> 'Node':
         """Returns first successor that hasn't failed"""
 
         for succ in self.succ_list:
-            if succ is not None:
+            if succ is not None and succ.alive:
                 return succ
         return
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from interface import Interface
+import snapshot
+
+# Read-only ring of a worker process, loaded by init_worker
+ring = None
+
+def init_worker(path: str) -> None:
+    global ring
+    ring = Interface.from_snapshot(path)
+
+def ping(delay: float) -> int:
+    """Keeps a worker busy for delay seconds, so every worker starts."""
+
+    time.sleep(delay)
+    return os.getpid()
+
+def route_chunk(key_hashes: list[int], start_node_id: int = None) -> tuple[list, dict]:
+    """Routes key_hashes on this worker's ring.
+    Returns ((owner id, hops) per key, worker stats)."""
+
+    start = perf_counter()
+    node = ring.get_node(start_node_id)
+    routed = []
+    hops = 0
+    for key_hash in key_hashes:
+        owner, owner_hops = node.find_successor_hops(key_hash)
+        routed.append((owner.id if owner is not None else None, owner_hops))
+        hops += owner_hops
+    stats = {"pid": os.getpid(), "lookups": len(key_hashes), "seconds": perf_counter() - start, "hops": hops}
+    return routed, stats
+
+class ParallelLookups:
+    """Runs read-only lookups on a pool of worker processes. Every worker
+    loads its own copy of the ring from a snapshot (item values stay
+    memory-mapped, so the OS shares their pages). Changes made to the
+    ring after the snapshot was saved aren't seen by the workers."""
+
+    def __init__(self, path: str, workers: int = None, chunk_size: int = 1000) -> None:
+        self.path = path
+        self.config = snapshot.read_config(path)
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(path,))
+
+    def __enter__(self) -> 'ParallelLookups':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def warm(self) -> None:
+        """Starts every worker and waits for it to load the ring,
+        so that loading isn't timed as part of the first lookups."""
+
+        list(self.pool.map(ping, [0.05] * self.workers * 2))
+
+    def find_successors(self, key_hashes: list[int], start_node_id: int = None) -> tuple[list, dict]:
+        """Routes key_hashes in chunks across the workers.
+        Returns ((owner id, hops) per key in input order, stats).
+        Stats hold the aggregate lookups per second and each worker's own."""
+
+        start = perf_counter()
+        futures = [self.pool.submit(route_chunk, key_hashes[i:i + self.chunk_size], start_node_id)
+                   for i in range(0, len(key_hashes), self.chunk_size)]
+        routed = []
+        workers = {}
+        for future in futures:
+            chunk, chunk_stats = future.result()
+            routed.extend(chunk)
+            worker = workers.setdefault(chunk_stats["pid"], {"pid": chunk_stats["pid"], "lookups": 0, "seconds": 0.0, "hops": 0})
+            for stat in ("lookups", "seconds", "hops"):
+                worker[stat] += chunk_stats[stat]
+        elapsed = perf_counter() - start
+
+        for worker in workers.values():
+            worker["qps"] = worker["lookups"] / worker["seconds"] if worker["seconds"] else 0.0
+        hops = sum(worker["hops"] for worker in workers.values())
+        stats = {
+            "workers": len(workers),
+            "lookups": len(key_hashes),
+            "seconds": elapsed,
+            "qps": len(key_hashes) / elapsed if elapsed else 0.0,
+            "mean_hops": hops / len(key_hashes) if key_hashes else 0.0,
+            "per_worker": sorted(workers.values(), key=lambda worker: worker["pid"]),
+        }
+        return routed, stats
+
+    def lookup_many(self, keys: list[str], start_node_id: int = None) -> tuple[dict, dict]:
+        """Finds the responsible node of many keys.
+        Returns (a dictionary key: (node id, hops), stats)."""
+
+        routed, stats = self.find_successors([self.config.hash_func(key) for key in keys], start_node_id)
+        return dict(zip(keys, routed)), stats
+
+    def insert_items(self, interface: Interface, new_items: list[tuple], start_node_id: int = None) -> dict:
+        """Inserts items (key, value) into interface, routing them on the
+        workers. interface should have the membership of the snapshot,
+        items routed to a node that isn't their owner are routed again.
+        Returns the routing stats."""
+
+        hashes = [self.config.hash_func(key) for key, _ in new_items]
+        routed, stats = self.find_successors(hashes, start_node_id)
+        interface.insert_routed([(key, value, key_hash, owner_id, hops)
+                                 for (key, value), key_hash, (owner_id, hops) in zip(new_items, hashes, routed)])
+        return stats
+
+def scaling(path: str, key_hashes: list[int], worker_counts: list[int]) -> dict:
+    """Aggregate lookups per second of the ring in path, per worker count."""
+
+    results = {}
+    for workers in worker_counts:
+        with ParallelLookups(path, workers) as lookups:
+            lookups.warm()
+            _, stats = lookups.find_successors(key_hashes)
+        results[workers] = stats
+    return results
@@ -0,0 +1,189 @@
+import cProfile
+import json
+import pstats
+import random
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+from node import Node
+
+# Node methods profiling hooks wrap by default
+HOOKS = ["find_successor", "find_successor_hops", "fix_fingers", "update_necessary_fingers", "move_items_to_pred"]
+
+def finger_index(node: Node, next: Node) -> int:
+    """Finger table entry node routed through to reach next. Fingers
+    above the one used are past the key, so it's the last entry pointing
+    to next. -1 if next isn't in the table (a successor list fallback)."""
+
+    for i in range(len(node.f_nodes) - 1, -1, -1):
+        if node.f_nodes[i] is next:
+            return i
+    return -1
+
+class LookupTracer:
+    """Records the path of a sample (sample_rate) of lookups: every hop's
+    node, the finger table entry it used and how long it took. Keeps the
+    last max_traces traces."""
+
+    def __init__(self, sample_rate: float = 0.01, max_traces: int = 1000, seed: int = None) -> None:
+        self.sample_rate = sample_rate
+        self.traces = deque(maxlen=max_traces)
+        self.rng = random.Random(seed)
+        self.sampled = 0
+
+    def sample(self) -> bool:
+        return self.rng.random() < self.sample_rate
+
+    def trace(self, start: Node, key: int) -> tuple[Node | None, int]:
+        """Routes key from start with Node.find_successor_path, recording
+        the path. Returns (responsible node, hops)."""
+
+        metrics = start.metrics
+        # Time each node was asked, the end of the hop to it
+        times = []
+
+        def visit(node: Node) -> None:
+            times.append(perf_counter_ns())
+            if metrics is not None:
+                metrics.request(node.id)
+
+        path = start.find_successor_path(key, visit)
+        times.append(perf_counter_ns())
+        hops = []
+        for i, (node, next) in enumerate(zip(path, path[1:])):
+            if i < len(times) - 2:
+                finger = finger_index(node, next)
+            else:
+                # Last hop to the successor, not asked for its closest preceding node
+                finger = 0 if next is node.f_nodes[0] else -1
+            hop = {"node": node.id, "next": next.id if next is not None else None, "finger": finger,
+                   "ns": times[i + 1] - times[i]}
+            if node.latency is not None and next is not None:
+                hop["latency_ms"] = node.latency.latency(node.id, next.id)
+            hops.append(hop)
+
+        owner = path[-1]
+        self.sampled += 1
+        self.traces.append({
+            "key": key,
+            "start": start.id,
+            "owner": owner.id if owner is not None else None,
+            "hops": hops,
+            "total_ns": times[-1] - times[0],
+        })
+        return owner, len(hops)
+
+    def slowest(self, count: int = 10) -> list[dict]:
+        return sorted(self.traces, key=lambda trace: trace["total_ns"], reverse=True)[:count]
+
+    def finger_usage(self) -> dict:
+        """How many traced hops used each finger table entry (-1: successor list)."""
+
+        return dict(Counter(hop["finger"] for trace in self.traces for hop in trace["hops"]))
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(list(self.traces), indent=indent)
+
+class Profiler:
+    """Times the hooked Node methods while hooks() is active.
+    Time is collected per stack of hooked calls, e.g.
+    "fix_fingers;find_successor", and written as collapsed stacks
+    (flamegraph.pl, speedscope). Every thread has its own stack. With
+    cprofile, the hooked calls are also run under cProfile, in one thread
+    at a time."""
+
+    def __init__(self, cprofile: bool = False) -> None:
+        # Per thread: hooked calls in progress
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # Time spent in a stack's last call itself, not in calls it made
+        self.self_ns = Counter()
+        self.calls = Counter()
+        self.profile = cProfile.Profile() if cprofile else None
+        # Thread running under cProfile
+        self.profiled_thread = None
+
+    @property
+    def stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def section(self, name: str):
+        """Times the block as a call of name."""
+
+        stack = self.stack
+        if not stack and self.profile is not None:
+            with self.lock:
+                if self.profiled_thread is None:
+                    self.profiled_thread = threading.get_ident()
+                    self.profile.enable()
+        stack.append([name, 0])
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter_ns() - start
+            _, children = stack[-1]
+            key = ";".join(frame[0] for frame in stack)
+            stack.pop()
+            with self.lock:
+                self.self_ns[key] += elapsed - children
+                self.calls[key] += 1
+                if not stack and self.profiled_thread == threading.get_ident():
+                    self.profile.disable()
+                    self.profiled_thread = None
+            if stack:
+                stack[-1][1] += elapsed
+
+    def wrap(self, name: str, method):
+        @wraps(method)
+        def hooked(*args, **kwargs):
+            with self.section(name):
+                return method(*args, **kwargs)
+        return hooked
+
+    @contextmanager
+    def hooks(self, names: list[str] = HOOKS):
+        """Wraps Node methods names for the duration of the block."""
+
+        originals = {name: getattr(Node, name) for name in names}
+        for name, method in originals.items():
+            setattr(Node, name, self.wrap(name, method))
+        try:
+            yield self
+        finally:
+            for name, method in originals.items():
+                setattr(Node, name, method)
+
+    def totals(self) -> dict:
+        """Per hooked method: calls and total time (ms), including the calls it made."""
+
+        totals = {}
+        for key, calls in self.calls.items():
+            name = key.rsplit(";", 1)[-1]
+            entry = totals.setdefault(name, {"calls": 0, "ms": 0.0})
+            entry["calls"] += calls
+        for key, self_ns in self.self_ns.items():
+            frames = key.split(";")
+            # Every method on the stack spent this time, once
+            for name in set(frames):
+                totals[name]["ms"] += self_ns / 1e6
+        return totals
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "stack self-µs" line each."""
+
+        return "".join(f"{key} {self_ns // 1000}\n" for key, self_ns in sorted(self.self_ns.items()))
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+    def stats(self) -> pstats.Stats:
+        if self.profile is None:
+            raise ValueError("Profiler was created without cprofile")
+        return pstats.Stats(self.profile)
@@ -0,0 +1,344 @@
+import random
+import numpy as np
+from config import RingConfig
+from host import load_stats
+
+# Largest key size: finger targets id + 2^i must fit in int64
+MAX_KEY_SIZE = 62
+# Spare finger table rows, as a fraction of the nodes, for joins
+SPARE_ROWS = 1 / 8
+
+class ArrayRing:
+    """Simulation backend that keeps the whole ring in NumPy arrays,
+    for rings of 100k-1M nodes on one machine.
+    Node i is the i-th smallest id, ids[i]. Its finger table is row
+    slots[i] of fingers, holding the slots of the finger nodes; slot_ids
+    maps a slot back to its id. A node keeps its slot while in the network,
+    so joins and leaves rewrite only the stale finger entries instead of
+    renumbering the whole matrix. Items live in one table and belong to the
+    node that succeeds their hash, so joins and leaves move no data. Offers
+    the operations of Interface, with node ids in place of Node objects.
+    Failures, replication and caching aren't modelled."""
+
+    def __init__(self, config: RingConfig = None) -> None:
+        self.config = config if config is not None else RingConfig()
+        if self.config.ks > MAX_KEY_SIZE:
+            raise ValueError(f"Array backend supports key sizes up to {MAX_KEY_SIZE} bits")
+        self.offsets = np.array([2**i for i in range(self.config.ks)], dtype=np.int64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.slots = np.empty(0, dtype=np.int32)
+        # Slots fit in int32, halving the finger matrix. Rows past the
+        # used ones are spare capacity for joins
+        self.fingers = np.empty((0, self.config.ks), dtype=np.int32)
+        self.slot_ids = np.empty(0, dtype=np.int64)
+        # Slots of nodes that left, reused by joins
+        self.free_slots = []
+        self.used_slots = 0
+        # key: (hash, value)
+        self.items = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index_of(self, key) -> np.ndarray:
+        """Index of the node responsible for key (or keys): the first id ≥ key."""
+
+        return np.searchsorted(self.ids, key) % len(self.ids)
+
+    def contains(self, node_ids) -> np.ndarray:
+        """True for each of node_ids that is in the network."""
+
+        if not len(self.ids):
+            return np.zeros(np.shape(node_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.ids, node_ids), len(self.ids) - 1)
+        return self.ids[pos] == node_ids
+
+    def index_range(self, start: int, end: int) -> np.ndarray:
+        """Indices of the nodes with id ∈ (start, end].
+        If start == end the range is the whole ring."""
+
+        lo = np.searchsorted(self.ids, start, side="right")
+        hi = np.searchsorted(self.ids, end, side="right")
+        if start < end:
+            return np.arange(lo, hi)
+        # Range wraps around zero
+        return np.concatenate((np.arange(lo, len(self.ids)), np.arange(0, hi)))
+
+    def finger_ids(self) -> np.ndarray:
+        """Finger table ids of every node, in id order."""
+
+        return self.slot_ids[self.fingers[self.slots]]
+
+    def rebuild(self) -> None:
+        """Recomputes every finger table at once. Node i gets slot i."""
+
+        count = len(self.ids)
+        capacity = count + int(count * SPARE_ROWS) + 1
+        self.slots = np.arange(count, dtype=np.int32)
+        self.slot_ids = np.empty(capacity, dtype=np.int64)
+        self.slot_ids[:count] = self.ids
+        self.free_slots = []
+        self.used_slots = count
+        self.fingers = np.empty((capacity, self.config.ks), dtype=np.int32)
+        if count:
+            # Column by column, to keep the temporary arrays small
+            for i, offset in enumerate(self.offsets.tolist()):
+                self.fingers[:count, i] = self.index_of((self.ids + offset) % self.config.hs)
+
+    def new_slot(self, node_id: int) -> int:
+        """Returns a free slot for node_id, growing the arrays if there's none."""
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.used_slots
+            self.used_slots += 1
+            if slot == len(self.slot_ids):
+                # Grow by a fraction of the size, so joins copy the
+                # matrix amortized O(1) times
+                extra = int(slot * SPARE_ROWS) + 1
+                self.fingers = np.concatenate((self.fingers, np.empty((extra, self.config.ks), dtype=np.int32)))
+                self.slot_ids = np.concatenate((self.slot_ids, np.empty(extra, dtype=np.int64)))
+        self.slot_ids[slot] = node_id
+        return slot
+
+    def build_network(self, node_count: int, node_ids: list = None) -> None:
+        """Creates nodes and inserts them into the network."""
+
+        self.node_join_many(node_ids if node_ids else self.random_ids(node_count))
+
+    def node_join_many(self, node_ids: list[int]) -> None:
+        """Joins many nodes at once, rebuilding the fingers in one pass."""
+
+        new_ids = np.sort(np.asarray(node_ids, dtype=np.int64))
+        # Drop duplicates and ids already in the network
+        new_ids = new_ids[np.diff(new_ids, prepend=-1) != 0]
+        new_ids = new_ids[~self.contains(new_ids)]
+        self.ids = np.sort(np.concatenate((self.ids, new_ids)))
+        self.rebuild()
+
+    def stale_rows(self, start: int, end: int) -> list[np.ndarray]:
+        """Per finger i, indices of the nodes whose finger i target is ∈ (start, end]:
+        node id ∈ (start - 2^i, end - 2^i]."""
+
+        hs = self.config.hs
+        return [self.index_range((start - offset) % hs, (end - offset) % hs) for offset in self.offsets.tolist()]
+
+    def node_join(self, new_node_id: int) -> int:
+        """Adds a node. Only the fingers whose target it now owns are rewritten.
+        Returns the number of finger table entries rewritten."""
+
+        pos = int(np.searchsorted(self.ids, new_node_id))
+        if pos < len(self.ids) and self.ids[pos] == new_node_id:
+            print(f"Node {new_node_id} already in the network.")
+            return 0
+        if not len(self.ids):
+            self.node_join_many([new_node_id])
+            return self.config.ks
+
+        pred_id = int(self.ids[pos - 1])
+        slot = self.new_slot(new_node_id)
+        self.ids = np.insert(self.ids, pos, new_node_id)
+        self.slots = np.insert(self.slots, pos, slot)
+        targets = (new_node_id + self.offsets) % self.config.hs
+        self.fingers[slot] = self.slots[self.index_of(targets)]
+
+        updated = 0
+        for i, rows in enumerate(self.stale_rows(pred_id, new_node_id)):
+            rows = rows[rows != pos]
+            self.fingers[self.slots[rows], i] = slot
+            updated += len(rows)
+        return updated
+
+    def node_leave(self, node_id: int) -> int:
+        """Removes a node. Fingers pointing at it move to its successor.
+        Returns the number of finger table entries rewritten."""
+
+        pos = int(np.searchsorted(self.ids, node_id))
+        if pos == len(self.ids) or self.ids[pos] != node_id:
+            print(f"Node {node_id} not found.")
+            return 0
+        if len(self.ids) == 1:
+            self.ids = self.ids[:0]
+            self.rebuild()
+            return 0
+
+        # Fingers pointing at the node target ∈ (pred, node]
+        stale = self.stale_rows(int(self.ids[pos - 1]), node_id)
+        succ_slot = self.slots[(pos + 1) % len(self.ids)]
+        updated = 0
+        for i, rows in enumerate(stale):
+            rows = rows[rows != pos]
+            self.fingers[self.slots[rows], i] = succ_slot
+            updated += len(rows)
+        self.free_slots.append(int(self.slots[pos]))
+        self.ids = np.delete(self.ids, pos)
+        self.slots = np.delete(self.slots, pos)
+        return updated
+
+    def route(self, keys, start_node_id: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """Chord lookup of many keys at once, each starting from the same node.
+        Every step jumps to the farthest finger ∈ (current, key], as
+        Node.closest_pre_node does. Returns (owner indices, hops)."""
+
+        keys = np.asarray(keys, dtype=np.int64)
+        start = self.index_of(start_node_id) if start_node_id is not None else 0
+        # Slots of the nodes the lookups are at
+        current = np.full(len(keys), self.slots[start], dtype=np.int64)
+        hops = np.zeros(len(keys), dtype=np.int64)
+        active = np.arange(len(keys))
+        while len(active):
+            nodes = current[active]
+            fingers = self.fingers[nodes]
+            node_ids = self.slot_ids[nodes]
+            finger_dist = (self.slot_ids[fingers] - node_ids[:, None]) % self.config.hs
+            key_dist = ((keys[active] - node_ids) % self.config.hs)[:, None]
+            # finger id ∈ (current, key]
+            finger_dist = np.where((finger_dist > 0) & (finger_dist <= key_dist), finger_dist, -1)
+            best = finger_dist.argmax(axis=1)
+            moved = finger_dist[np.arange(len(active)), best] > 0
+            current[active[moved]] = fingers[moved, best[moved]]
+            hops[active[moved]] += 1
+            active = active[moved]
+
+        # Last node precedes the key, unless it's the key itself
+        current_ids = self.slot_ids[current]
+        at_key = current_ids == keys
+        positions = np.searchsorted(self.ids, current_ids)
+        owners = np.where(at_key, positions, (positions + 1) % len(self.ids))
+        return owners, hops + ~at_key
+
+    def find_successor(self, key: int, start_node_id: int = None) -> int:
+        """Returns the id of the node responsible for key."""
+
+        owners, _ = self.route([key], start_node_id)
+        return int(self.ids[owners[0]])
+
+    def lookup_many(self, keys: list[str], start_node_id: int = None) -> dict:
+        """Finds the responsible node of many keys.
+        Returns a dictionary key: (node id, hops)."""
+
+        hashes = [self.config.hash_func(key) for key in keys]
+        owners, hops = self.route(hashes, start_node_id)
+        return {key: (int(self.ids[owner]), int(hop)) for key, owner, hop in zip(keys, owners, hops)}
+
+    def insert_item(self, new_item: tuple, start_node_id: int = None) -> None:
+        """Inserts an item (key, value) to the network."""
+
+        self.items[new_item[0]] = (self.config.hash_func(new_item[0]), new_item[1])
+
+    def insert_all_data(self, dict_items: list[tuple], start_node_id: int = None) -> None:
+        """Inserts all data from parsed csv."""
+
+        hash_func = self.config.hash_func
+        self.items.update((key, (hash_func(key), value)) for key, value in dict_items)
+
+    def get_item(self, key: str, start_node_id: int = None):
+        """Returns the value of an item given its key, or None if it's not found."""
+
+        item = self.items.get(key)
+        return item[1] if item is not None else None
+
+    def update_record(self, new_item: tuple, start_node_id: int = None) -> None:
+        """Updates the record (value) of an item given its key."""
+
+        if new_item[0] not in self.items:
+            print(f"Could not find item with key {new_item[0]}")
+            return
+        self.insert_item(new_item)
+
+    def delete_item(self, key: str, start_node_id: int = None) -> None:
+        """Removes the (key, value) entry from the network."""
+
+        if self.items.pop(key, None) is None:
+            print(f"Key {key} not found")
+
+    def node_items(self, node_id: int) -> list[str]:
+        """Keys of the items the node is responsible for."""
+
+        pos = self.index_of(node_id)
+        start = int(self.ids[pos - 1])
+        return [key for key, (key_hash, _) in self.items.items() if self.config.in_range(key_hash, start, node_id)]
+
+    def item_counts(self) -> np.ndarray:
+        """Number of items per node, in id order."""
+
+        hashes = np.fromiter((key_hash for key_hash, _ in self.items.values()), dtype=np.int64, count=len(self.items))
+        return np.bincount(self.index_of(hashes), minlength=len(self.ids))
+
+    def load_report(self) -> dict:
+        """Owned arc of the ring and item count per node,
+        with mean, max, max/mean and Gini coefficient."""
+
+        arcs = (self.ids - np.roll(self.ids, 1)) % self.config.hs
+        # A lone node owns the whole ring
+        arcs[arcs == 0] = self.config.hs
+        return {
+            "nodes": len(self.ids),
+            "arc": load_stats(arcs.tolist()),
+            "items": load_stats(self.item_counts().tolist()),
+        }
+
+    def exact_match(self, key: int, start_node_id: int = None) -> int | None:
+        """Returns the id of the node with id same as a given key, if it exists."""
+
+        node_id = self.find_successor(key, start_node_id)
+        if node_id != key:
+            print(f"Couldn't find node with id {key}.")
+            return
+        return node_id
+
+    def range_query(self, start: int, end: int, start_node_id: int = None) -> list[int]:
+        """Lists the node ids in the range [start, end]."""
+
+        return self.ids[self.index_range((start - 1) % self.config.hs, end)].tolist()
+
+    def knn(self, k: int, node_id: int, start_node_id: int = None) -> list[int]:
+        """Lists the ids of the k nearest nodes of node, given a specific id."""
+
+        if not self.contains(node_id):
+            print(f"Couldn't find node with id {node_id}.")
+            return
+        # Node is the nearest to its own id
+        return self.knn_key(k + 1, node_id)[1:]
+
+    def knn_key(self, k: int, key: int, start_node_id: int = None) -> list[int]:
+        """Lists the ids of the k nodes nearest to key, nearest first.
+        Unlike knn, the node responsible for key is listed too."""
+
+        count = len(self.ids)
+        if 2 * k >= count:
+            candidates = self.ids
+        else:
+            owner = int(self.index_of(key))
+            candidates = self.ids[(owner + np.arange(-k, k)) % count]
+        cw = (candidates - key) % self.config.hs
+        ccw = (key - candidates) % self.config.hs
+        # By ring distance, ties go to the successor
+        order = np.lexsort((cw, np.minimum(cw, ccw)))
+        return candidates[order[:k]].tolist()
+
+    def print_all_nodes(self) -> None:
+        """Prints all nodes of the network"""
+
+        print([hex(node_id) for node_id in self.ids.tolist()])
+
+    def get_random_node(self) -> int:
+        """Returns the id of a random node in the network."""
+
+        return int(random.choice(self.ids))
+
+    def random_ids(self, count: int) -> list[int]:
+        """Returns count distinct random ids of the hashing space, not in the network."""
+
+        ids = np.asarray(random.sample(range(self.config.hs), count), dtype=np.int64)
+        ids = ids[~self.contains(ids)].tolist()
+        if len(ids) == count:
+            return ids
+        # Some were taken, draw the rest one by one
+        free = set(ids)
+        while len(free) < count:
+            new_id = random.randrange(self.config.hs)
+            if not self.contains(new_id):
+                free.add(new_id)
+        return list(free)
@@ -0,0 +1,260 @@
+import json
+import os
+import pickle
+from collections.abc import MutableMapping
+from bisect import bisect_left
+import numpy as np
+from config import RingConfig
+from host import Host
+
+FORMAT_VERSION = 1
+# Pointers to missing nodes (successor lists shorter than SLS, no host)
+NONE = -1
+
+# Value of items still encoded in the snapshot
+PENDING = object()
+
+class ValueStore:
+    """Memory-mapped value column of a snapshot: pickled values back to back."""
+
+    def __init__(self, path: str) -> None:
+        self.offsets = np.load(os.path.join(path, "value_offsets.npy"), mmap_mode="r")
+        self.blob = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+
+    def decode(self, row: int):
+        return pickle.loads(self.blob[self.offsets[row]:self.offsets[row + 1]])
+
+class MappedItems(MutableMapping):
+    """Node items loaded from a snapshot. Values stay in the memory-mapped
+    value column until first read, then are kept decoded."""
+
+    def __init__(self, store: ValueStore, keys: list[str], rows: range) -> None:
+        self.store = store
+        # key: value, PENDING until decoded
+        self.data = dict.fromkeys(keys, PENDING)
+        # key: row of its value in the store
+        self.rows = dict(zip(keys, rows))
+
+    def __getitem__(self, key: str):
+        value = self.data[key]
+        if value is PENDING:
+            value = self.store.decode(self.rows.pop(key))
+            self.data[key] = value
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        self.rows.pop(key, None)
+        self.data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+        self.rows.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+class MappedReplicas(MutableMapping):
+    """Node replicas loaded from a snapshot: key: (hash, value). They're
+    copies of their owners' items, so values are read from the same rows
+    of the value column on first access."""
+
+    def __init__(self, store: ValueStore) -> None:
+        self.store = store
+        # key: (hash, value), value PENDING until decoded
+        self.data = {}
+        # key: row of its value in the store
+        self.rows = {}
+
+    def add(self, keys: list[str], hashes: list[int], rows: range) -> None:
+        self.data.update(zip(keys, [(key_hash, PENDING) for key_hash in hashes]))
+        self.rows.update(zip(keys, rows))
+
+    def __getitem__(self, key: str) -> tuple:
+        key_hash, value = self.data[key]
+        if value is PENDING:
+            value = self.store.decode(self.rows.pop(key))
+            self.data[key] = (key_hash, value)
+        return key_hash, value
+
+    def __setitem__(self, key: str, entry: tuple) -> None:
+        self.rows.pop(key, None)
+        self.data[key] = entry
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+        self.rows.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def items(self):
+        """Entries as stored, values not read yet are PENDING. Lets nodes
+        scan replica hashes without decoding values."""
+        return self.data.items()
+
+def id_width(config: RingConfig) -> int:
+    """Bytes per id: ids can be wider than 64 bits."""
+
+    return (config.ks + 7) // 8
+
+def encode_ids(ids: list[int], width: int) -> np.ndarray:
+    """Ids as rows of width big-endian bytes."""
+
+    raw = b"".join(i.to_bytes(width, "big") for i in ids)
+    return np.frombuffer(raw, dtype=np.uint8).reshape(len(ids), width)
+
+def decode_ids(rows: np.ndarray) -> list[int]:
+    raw = rows.tobytes()
+    width = rows.shape[1]
+    return [int.from_bytes(raw[i:i + width], "big") for i in range(0, len(raw), width)]
+
+def encode_column(values: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    """Variable length values as (offsets, blob); value i is blob[offsets[i]:offsets[i + 1]]."""
+
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in values], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(values), dtype=np.uint8)
+
+def save(interface, path: str) -> None:
+    """Writes the nodes, finger tables, successor lists and items of
+    interface to directory path. Pointers to failed nodes are saved as
+    the alive node that now covers them."""
+
+    os.makedirs(path, exist_ok=True)
+    config = interface.config
+    ids = sorted(interface.nodes)
+    if not ids:
+        raise ValueError("Network is empty, nothing to save")
+    nodes = [interface.nodes[node_id] for node_id in ids]
+    count = len(ids)
+    position = {node_id: pos for pos, node_id in enumerate(ids)}
+
+    def index(node) -> int:
+        if node.id in position and node.alive:
+            return position[node.id]
+        # Failed node: its range now belongs to the next alive node
+        return bisect_left(ids, node.id) % count
+
+    preds = np.array([position[node.pred.id] if node.pred.alive else (pos - 1) % count
+                      for pos, node in enumerate(nodes)], dtype=np.int32)
+    fingers = np.array([[index(finger) for finger in node.f_nodes] for node in nodes],
+                       dtype=np.int32).reshape(count, config.ks)
+    succ_lists = np.full((count, config.sls), NONE, dtype=np.int32)
+    for pos, node in enumerate(nodes):
+        alive = [position[succ.id] for succ in node.succ_list if succ is not None and succ.alive]
+        succ_lists[pos, :len(alive)] = alive
+    hosts = np.array([node.host.id if node.host is not None else NONE for node in nodes], dtype=np.int32)
+    # Positions in join order: the first node joined is the default start node
+    join_order = np.array([position[node_id] for node_id in interface.nodes], dtype=np.int32)
+
+    # Items grouped by node, sorted by hash within each node
+    item_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(node.index) for node in nodes], out=item_offsets[1:])
+    item_hashes = [key_hash for node in nodes for key_hash in node.index.hashes]
+    keys = [key for node in nodes for key in node.index.keys]
+    values = [pickle.dumps(nodes[pos].items[key], protocol=pickle.HIGHEST_PROTOCOL)
+              for pos in range(count) for key in nodes[pos].index.keys]
+    key_offsets, key_blob = encode_column([key.encode("utf-8") for key in keys])
+    value_offsets, value_blob = encode_column(values)
+
+    width = id_width(config)
+    arrays = {
+        "node_ids": encode_ids(ids, width),
+        "preds": preds,
+        "fingers": fingers,
+        "succ_lists": succ_lists,
+        "hosts": hosts,
+        "join_order": join_order,
+        "item_offsets": item_offsets,
+        "item_hashes": encode_ids(item_hashes, width),
+        "key_offsets": key_offsets,
+        "keys": key_blob,
+        "value_offsets": value_offsets,
+        "values": value_blob,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    meta = {
+        "version": FORMAT_VERSION,
+        "key_size": config.ks,
+        "succ_list_size": config.sls,
+        "replication": config.replication,
+        "read_quorum": config.read_quorum,
+        "write_quorum": config.write_quorum,
+        "nodes": count,
+        "items": len(keys),
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def read_config(path: str) -> RingConfig:
+    """Returns the configuration of the ring saved in path."""
+
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta['version']}")
+    return RingConfig(meta["key_size"], meta["succ_list_size"], meta["replication"],
+                      meta["read_quorum"], meta["write_quorum"])
+
+def load(interface, path: str) -> None:
+    """Fills an empty interface, built with read_config(path), from the
+    snapshot in path. Item and replica values are decoded on first access.
+    Values are pickled, only load snapshots from a trusted source."""
+
+    if interface.nodes:
+        raise ValueError("Snapshots can only be loaded into an empty network")
+
+    def array(name: str, mmap: bool = False) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+    ids = decode_ids(array("node_ids"))
+    preds = array("preds").tolist()
+    fingers = array("fingers").tolist()
+    succ_lists = array("succ_lists").tolist()
+    hosts = array("hosts").tolist()
+    join_order = array("join_order").tolist()
+
+    for host_id in sorted(set(hosts) - {NONE}):
+        interface.hosts[host_id] = Host(host_id)
+    nodes = [interface.new_node(node_id, interface.hosts.get(host_id)) for node_id, host_id in zip(ids, hosts)]
+    for pos, node in enumerate(nodes):
+        node.pred = nodes[preds[pos]]
+        for i, finger in enumerate(fingers[pos]):
+            node.set_finger(i, nodes[finger])
+        node.succ_list = [nodes[succ] if succ != NONE else None for succ in succ_lists[pos]]
+    for pos in join_order:
+        interface.add_member(nodes[pos], keep_sorted=False)
+    interface.sort_members()
+
+    item_offsets = array("item_offsets").tolist()
+    item_hashes = decode_ids(array("item_hashes"))
+    key_offsets = array("key_offsets").tolist()
+    key_blob = array("keys", mmap=True).tobytes()
+    store = ValueStore(path)
+    for node in nodes:
+        node.replicas = MappedReplicas(store)
+    for pos, node in enumerate(nodes):
+        lo, hi = item_offsets[pos], item_offsets[pos + 1]
+        keys = [key_blob[key_offsets[row]:key_offsets[row + 1]].decode("utf-8") for row in range(lo, hi)]
+        node.items = MappedItems(store, keys, range(lo, hi))
+        node.item_hashes = dict(zip(keys, item_hashes[lo:hi]))
+        # Saved sorted by hash, the index needs no sorting
+        node.index.hashes = item_hashes[lo:hi]
+        node.index.keys = keys
+        # Replicas point to the same rows as their owner's items
+        if interface.config.replication > 1:
+            for holder in node.replica_holders()[1:]:
+                holder.replicas.add(keys, item_hashes[lo:hi], range(lo, hi))
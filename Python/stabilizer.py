@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from time import perf_counter, thread_time
+
+# Maintenance tasks run on every node, in order
+TASKS = ["stabilize", "fix_finger", "succ_list"]
+
+class Stabilizer:
+    """Runs the periodic maintenance of an Interface's nodes:
+    stabilize/notify, one finger per node and successor list refresh.
+    Each task sweeps all nodes once per period (seconds). A tick spends
+    at most budget seconds of its thread's CPU time and resumes where the last one
+    stopped. Unless the interface is thread safe, don't change the
+    network from another thread while it runs in a thread; if it is,
+    every task runs under the ring's write lock."""
+
+    def __init__(self, interface, stabilize_period: float = 0.1, finger_period: float = 0.1,
+                 succ_list_period: float = 0.5, tick_period: float = 0.02, budget: float = 0.005) -> None:
+        self.interface = interface
+        self.periods = {
+            "stabilize": stabilize_period,
+            "fix_finger": finger_period,
+            "succ_list": succ_list_period,
+        }
+        self.tick_period = tick_period
+        self.budget = budget
+        # task: time the next sweep is due
+        self.next_due = {task: 0.0 for task in TASKS}
+        # task: node ids left in the current sweep
+        self.pending = {task: [] for task in TASKS}
+        # task: start time of the current sweep
+        self.sweep_start = {task: 0.0 for task in TASKS}
+        # task: consecutive full sweeps that changed nothing
+        self.clean = {task: 0 for task in TASKS}
+        # Time of the first change since the ring last converged
+        self.dirty_since = None
+        self.last_change = 0.0
+        # Interface membership version the last sweeps saw
+        self.membership_version = interface.membership_version
+        self.metrics = {
+            "ticks": 0,
+            "over_budget_ticks": 0,
+            "runs": {task: 0 for task in TASKS},
+            "changes": {task: 0 for task in TASKS},
+            "sweeps": {task: 0 for task in TASKS},
+            "cpu_seconds": 0.0,
+            "convergence_times": [],
+        }
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def run_task(self, task: str, node) -> bool:
+        with self.interface.write_locked():
+            if not node.alive:
+                return False
+            if task == "stabilize":
+                return node.stabilize()
+            if task == "fix_finger":
+                return node.fix_next_finger()
+            return node.fix_successor_list()
+
+    def mark_dirty(self) -> None:
+        """Records a membership change, starting a convergence measurement."""
+
+        now = perf_counter()
+        self.last_change = now
+        if self.dirty_since is None:
+            self.dirty_since = now
+        for task in TASKS:
+            self.clean[task] = 0
+
+    def check_membership(self) -> None:
+        """Marks the ring dirty if nodes joined, left or failed since the
+        last check, e.g. node_join/node_leave with maintain false."""
+
+        if self.interface.membership_version != self.membership_version:
+            self.membership_version = self.interface.membership_version
+            self.mark_dirty()
+
+    def converged(self) -> bool:
+        """True if every task has swept all nodes without changes since
+        the last change. fix_finger refreshes one entry per node per sweep,
+        so it needs a clean sweep per finger table entry."""
+
+        self.check_membership()
+        return all(self.clean[task] >= self.sweeps_needed(task) for task in TASKS)
+
+    def sweeps_needed(self, task: str) -> int:
+        return self.interface.config.ks - 1 if task == "fix_finger" else 1
+
+    def tick(self) -> None:
+        """Runs due maintenance until the CPU budget is spent."""
+
+        self.check_membership()
+        now = perf_counter()
+        cpu_start = thread_time()
+        self.metrics["ticks"] += 1
+        for task in TASKS:
+            pending = self.pending[task]
+            if not pending:
+                if now < self.next_due[task]:
+                    continue
+                # Start a new sweep over all nodes
+                pending.extend(reversed(list(self.interface.nodes)))
+                self.sweep_start[task] = now
+                self.next_due[task] = now + self.periods[task]
+
+            while pending:
+                if thread_time() - cpu_start >= self.budget:
+                    self.metrics["over_budget_ticks"] += 1
+                    self.metrics["cpu_seconds"] += thread_time() - cpu_start
+                    return
+                node = self.interface.nodes.get(pending.pop())
+                # Node left since the sweep started
+                if node is None:
+                    continue
+                self.metrics["runs"][task] += 1
+                if self.run_task(task, node):
+                    self.metrics["changes"][task] += 1
+                    self.mark_dirty()
+
+            self.metrics["sweeps"][task] += 1
+            # Sweep started after the last change and changed nothing
+            if self.sweep_start[task] >= self.last_change:
+                self.clean[task] += 1
+                if self.dirty_since is not None and self.converged():
+                    self.metrics["convergence_times"].append(perf_counter() - self.dirty_since)
+                    self.dirty_since = None
+
+        self.metrics["cpu_seconds"] += thread_time() - cpu_start
+
+    def run_until_converged(self, max_ticks: int = 100000) -> int:
+        """Ticks back to back until converged. Returns the ticks used."""
+
+        for ticks in range(1, max_ticks + 1):
+            # Sweeps are due immediately when running back to back
+            self.next_due = {task: 0.0 for task in TASKS}
+            self.tick()
+            if self.converged():
+                return ticks
+        return max_ticks
+
+    def start(self) -> None:
+        """Runs ticks in a background thread."""
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run_thread, daemon=True)
+        self.thread.start()
+
+    def run_thread(self) -> None:
+        while not self.stop_event.wait(self.tick_period):
+            self.tick()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    async def run_async(self) -> None:
+        """Runs ticks on the event loop until cancelled."""
+
+        while True:
+            self.tick()
+            await asyncio.sleep(self.tick_period)
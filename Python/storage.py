@@ -0,0 +1,371 @@
+import json
+import os
+import pickle
+import shutil
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from config import RingConfig
+
+# Record header: crc32 of the rest of the record, operation, key length, value length
+HEADER = struct.Struct("<IBII")
+BODY = struct.Struct("<BII")
+PUT = 1
+DELETE = 2
+# Segment files kept open at once, across all stores
+MAX_OPEN_FILES = 256
+# Binary mode on Windows, 0 elsewhere
+O_BINARY = getattr(os, "O_BINARY", 0)
+# Positioned reads, not on Windows
+PREAD = hasattr(os, "pread")
+
+class OpenFile:
+    """A cached file descriptor and the number of reads/appends using it."""
+
+    __slots__ = ["fd", "users", "closed"]
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+        self.users = 0
+        # Evicted or closed while in use: the last user closes it
+        self.closed = False
+
+class FileCache:
+    """Open segment files, least recently used closed first,
+    so big rings don't run out of file descriptors. The lock only guards
+    the cache: reads (pread) and appends run outside it, holding a
+    reference so the file isn't closed under them."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        # path: OpenFile
+        self.fds = OrderedDict()
+        self.lock = threading.Lock()
+
+    def read(self, path: str, offset: int, length: int) -> bytes:
+        file = self.acquire(path)
+        try:
+            if PREAD:
+                return os.pread(file.fd, length, offset)
+            # No pread (Windows): seek and read can't interleave
+            with self.lock:
+                os.lseek(file.fd, offset, os.SEEK_SET)
+                return os.read(file.fd, length)
+        finally:
+            self.release(file)
+
+    def append(self, path: str, data: bytes, sync: bool) -> None:
+        file = self.acquire(path)
+        try:
+            os.write(file.fd, data)
+            if sync:
+                os.fsync(file.fd)
+        finally:
+            self.release(file)
+
+    def acquire(self, path: str) -> OpenFile:
+        with self.lock:
+            file = self.fds.get(path)
+            if file is not None:
+                self.fds.move_to_end(path)
+            else:
+                file = OpenFile(os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND | O_BINARY, 0o644))
+                self.fds[path] = file
+                self.evict()
+            file.users += 1
+            return file
+
+    def release(self, file: OpenFile) -> None:
+        with self.lock:
+            file.users -= 1
+            if file.closed and not file.users:
+                os.close(file.fd)
+
+    def evict(self) -> None:
+        """Closes least recently used files over size. Files in use are
+        dropped from the cache and closed by their last user."""
+
+        while len(self.fds) > self.size:
+            self.drop(self.fds.popitem(last=False)[1])
+
+    def drop(self, file: OpenFile) -> None:
+        if file.users:
+            file.closed = True
+        else:
+            os.close(file.fd)
+
+    def close(self, path: str) -> None:
+        with self.lock:
+            file = self.fds.pop(path, None)
+            if file is not None:
+                self.drop(file)
+
+files = FileCache(MAX_OPEN_FILES)
+
+def record_size(key: bytes, length: int) -> int:
+    return HEADER.size + len(key) + length
+
+def encode(op: int, key: bytes, value: bytes) -> bytes:
+    body = BODY.pack(op, len(key), len(value))
+    crc = zlib.crc32(value, zlib.crc32(key, zlib.crc32(body)))
+    return b"".join((struct.pack("<I", crc), body, key, value))
+
+class LogStore(MutableMapping):
+    """Durable items of a node: an append-only log of put/delete records,
+    in numbered segment files of directory path, and an in-memory index
+    key: (segment, value offset, value length). Values stay on disk, so a
+    node can hold more than fits in memory.
+    Writes are committed in groups of batch records (group commit), with
+    an fsync if sync; records not committed yet are lost on a crash.
+    A segment is closed once it reaches segment_size bytes, and the log is
+    compacted when more than half of it is garbage."""
+
+    def __init__(self, path: str, batch: int = 64, sync: bool = True,
+                 segment_size: int = 64 * 2**20, min_compact: int = 2**20) -> None:
+        self.path = path
+        self.batch = batch
+        self.sync = sync
+        self.segment_size = segment_size
+        self.min_compact = min_compact
+        os.makedirs(path, exist_ok=True)
+        self.index = {}
+        # segment: committed bytes
+        self.sizes = {}
+        # Segment appended to
+        self.active = 0
+        # Records appended to the active segment, not committed yet
+        self.buffer = bytearray()
+        self.pending = 0
+        # Bytes of live records and of overwritten or deleted ones
+        self.live = 0
+        self.garbage = 0
+        self.replay()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:08d}.log")
+
+    def replay(self) -> None:
+        """Rebuilds the index from the segments, without decoding values.
+        A torn record at the end of a segment (crash mid-write) is cut off."""
+
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith(".log"))
+        for segment in segments:
+            with open(self.segment_path(segment), "rb") as f:
+                data = memoryview(f.read())
+            pos = 0
+            while pos + HEADER.size <= len(data):
+                crc, op, key_length, length = HEADER.unpack_from(data, pos)
+                key_end = pos + HEADER.size + key_length
+                end = key_end + length
+                if end > len(data) or zlib.crc32(data[pos + 4:end]) != crc:
+                    break
+                key = bytes(data[pos + HEADER.size:key_end]).decode("utf-8")
+                self.drop(key)
+                if op == PUT:
+                    self.index[key] = (segment, key_end, length)
+                    self.live += end - pos
+                else:
+                    self.garbage += end - pos
+                pos = end
+            if pos < len(data):
+                os.truncate(self.segment_path(segment), pos)
+            self.sizes[segment] = pos
+        self.active = segments[-1] if segments else 0
+        self.sizes.setdefault(self.active, 0)
+
+    def drop(self, key: str) -> None:
+        """Turns key's live record, if any, into garbage."""
+
+        if key in self.index:
+            length = record_size(key.encode("utf-8"), self.index.pop(key)[2])
+            self.live -= length
+            self.garbage += length
+
+    def append(self, record: bytes, key_length: int) -> tuple[int, int]:
+        """Appends an encoded record to the active segment.
+        Returns (segment, offset of the value)."""
+
+        if self.sizes[self.active] + len(self.buffer) >= self.segment_size:
+            self.flush()
+            self.active += 1
+            self.sizes[self.active] = 0
+        offset = self.sizes[self.active] + len(self.buffer) + HEADER.size + key_length
+        self.buffer += record
+        self.pending += 1
+        return self.active, offset
+
+    def tombstone(self, key: str) -> None:
+        """Appends a delete record of key, without committing it."""
+
+        self.drop(key)
+        encoded_key = key.encode("utf-8")
+        self.garbage += record_size(encoded_key, 0)
+        self.append(encode(DELETE, encoded_key, b""), len(encoded_key))
+
+    def flush(self) -> None:
+        """Writes the buffered records to the active segment."""
+
+        if not self.buffer:
+            return
+        files.append(self.segment_path(self.active), self.buffer, self.sync)
+        self.sizes[self.active] += len(self.buffer)
+        self.buffer = bytearray()
+        self.pending = 0
+
+    def commit(self) -> None:
+        """Writes the buffered records, then compacts if it's time to."""
+
+        self.flush()
+        if self.garbage >= self.min_compact and self.garbage > self.live:
+            self.compact()
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+        committed = self.sizes[segment]
+        if segment == self.active and offset >= committed:
+            return bytes(self.buffer[offset - committed:offset - committed + length])
+        return files.read(self.segment_path(segment), offset, length)
+
+    def read_record(self, key: str) -> tuple[bytes, int]:
+        """Returns key's encoded record and key length."""
+
+        segment, offset, length = self.index[key]
+        key_length = len(key.encode("utf-8"))
+        return self.read(segment, offset - HEADER.size - key_length, HEADER.size + key_length + length), key_length
+
+    def __getitem__(self, key: str):
+        segment, offset, length = self.index[key]
+        return pickle.loads(self.read(segment, offset, length))
+
+    def __setitem__(self, key: str, value) -> None:
+        encoded_key = key.encode("utf-8")
+        encoded = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.drop(key)
+        segment, offset = self.append(encode(PUT, encoded_key, encoded), len(encoded_key))
+        self.index[key] = (segment, offset, len(encoded))
+        self.live += record_size(encoded_key, len(encoded))
+        if self.pending >= self.batch:
+            self.commit()
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self.index:
+            raise KeyError(key)
+        self.tombstone(key)
+        if self.pending >= self.batch:
+            self.commit()
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def compact(self) -> None:
+        """Copies the live records, in log order, to new segments and
+        deletes the old ones, along with all garbage."""
+
+        self.flush()
+        old = sorted(self.sizes)
+        records = sorted(self.index.items(), key=lambda item: item[1])
+        self.active = old[-1] + 1
+        self.sizes[self.active] = 0
+        for key, (_, _, length) in records:
+            record, key_length = self.read_record(key)
+            self.index[key] = self.append(record, key_length) + (length,)
+        self.flush()
+        for segment in old:
+            files.close(self.segment_path(segment))
+            if os.path.exists(self.segment_path(segment)):
+                os.remove(self.segment_path(segment))
+            del self.sizes[segment]
+        self.garbage = 0
+
+    def move_to(self, other: 'LogStore', keys: list[str]) -> None:
+        """Moves keys to other without decoding their values. All of this
+        store's keys move by handing its segments over; otherwise their
+        records are copied in one batch and deleted here."""
+
+        if not keys:
+            return
+        if len(keys) == len(self.index):
+            self.hand_over(other)
+            return
+        for key in sorted(keys, key=self.index.__getitem__):
+            record, key_length = self.read_record(key)
+            other.drop(key)
+            other.index[key] = other.append(record, key_length) + (self.index[key][2],)
+            other.live += len(record)
+        other.commit()
+        for key in keys:
+            self.tombstone(key)
+        self.commit()
+
+    def hand_over(self, other: 'LogStore') -> None:
+        """Moves every segment file to other, after compacting this store so
+        they hold only live records. other appends after them, so its later
+        records still win on replay."""
+
+        if self.garbage:
+            self.compact()
+        self.flush()
+        other.flush()
+        renamed = {}
+        for segment in sorted(self.sizes):
+            files.close(self.segment_path(segment))
+            if not self.sizes[segment]:
+                continue
+            other.active += 1
+            os.replace(self.segment_path(segment), other.segment_path(other.active))
+            other.sizes[other.active] = self.sizes[segment]
+            renamed[segment] = other.active
+        other.active += 1
+        other.sizes[other.active] = 0
+        for key, (segment, offset, length) in self.index.items():
+            other.drop(key)
+            other.index[key] = (renamed[segment], offset, length)
+        other.live += self.live
+
+        self.active = max(self.sizes) + 1
+        self.sizes = {self.active: 0}
+        self.index = {}
+        self.live = 0
+
+    def close(self) -> None:
+        self.flush()
+        for segment in self.sizes:
+            files.close(self.segment_path(segment))
+
+    def destroy(self) -> None:
+        """Closes the store and deletes its directory, and every item with it."""
+
+        self.buffer = bytearray()
+        self.close()
+        self.index = {}
+        self.live = self.garbage = 0
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def save_config(path: str, config: RingConfig) -> None:
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "ring.json"), "w") as f:
+        json.dump({
+            "key_size": config.ks,
+            "succ_list_size": config.sls,
+            "replication": config.replication,
+            "read_quorum": config.read_quorum,
+            "write_quorum": config.write_quorum,
+        }, f, indent=2)
+
+def read_config(path: str) -> RingConfig:
+    with open(os.path.join(path, "ring.json")) as f:
+        meta = json.load(f)
+    return RingConfig(meta["key_size"], meta["succ_list_size"], meta["replication"],
+                      meta["read_quorum"], meta["write_quorum"])
+
+def node_ids(path: str) -> list[int]:
+    """Ids of the nodes stored in path, one directory each, named by hex id."""
+
+    return [int(name, 16) for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))]